@@ -2,7 +2,10 @@
 
 import json
 import os
-from dataclasses import asdict
+import threading
+import time
+from dataclasses import asdict, replace
+from datetime import datetime, timezone
 from pathlib import Path
 from urllib.parse import quote
 
@@ -11,14 +14,56 @@ import structlog
 from authlib.integrations.flask_client import OAuth
 from flask import Flask, redirect, request, render_template, session, url_for
 from flask_htmx import HTMX
-from flask_login import LoginManager, login_required, login_user, logout_user
+from flask_login import (
+    LoginManager,
+    current_user,
+    login_required,
+    login_user,
+    logout_user,
+)
 from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
 from frictionless import Package
-
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from parquet_fe_prototype.admission import (
+    AdmissionController,
+    ALLOW,
+    DOWNGRADE,
+    REJECT,
+    Decision,
+)
+from parquet_fe_prototype.catalog import CatalogResource, build_catalog
+from parquet_fe_prototype.counts import (
+    CountCache,
+    LRUCache,
+    filters_hash,
+    normalize_filters,
+)
+from parquet_fe_prototype.dictionaries import TableDictionary, load_dictionaries
 from parquet_fe_prototype.models import db, User
-from parquet_fe_prototype.duckdb_query import ag_grid_to_duckdb, Filter
+from parquet_fe_prototype.duckdb_query import (
+    ag_grid_to_duckdb,
+    approximate_preview,
+    page_range,
+    Filter,
+    QuerySpec,
+    Sort,
+)
+from parquet_fe_prototype.parquet_metadata import (
+    NIGHTLY_PARQUET_BASE,
+    ParquetMetadataCache,
+    ScanCost,
+    TableMetadata,
+    estimate_scan_cost,
+)
 from parquet_fe_prototype.search import initialize_index, run_search
+from parquet_fe_prototype.telemetry import (
+    QueryRecord,
+    TelemetryWriter,
+    filter_shape,
+    hot_tables,
+)
 from parquet_fe_prototype.utils import clean_descriptions
 
 AUTH0_DOMAIN = os.getenv("PUDL_VIEWER_AUTH0_DOMAIN")
@@ -80,20 +125,56 @@ def __init_db(db: SQLAlchemy, app: Flask):
     migrate.init_app(app, db)
 
 
+def sort_resources_by_name(resource: CatalogResource) -> int:
+    name = resource.name
+
+    # make these tables show up first, by returning negative numbers.
+    first_tables = [
+        "out_eia__monthly_generators",
+        "out_eia923__fuel_receipts_costs",
+        "out_ferc1__yearly_all_plants",
+        "out_eia__yearly_generators",
+    ]
+    if name in first_tables:
+        return first_tables.index(name) - len(first_tables) - 1
+
+    if name.startswith("out"):
+        return 0
+    if name.startswith("core"):
+        return 1
+    if name.startswith("_out"):
+        return 2
+    if name.startswith("_core"):
+        return 3
+    return 4
+
+
 def __build_search_index(app):
     """Create a search index.
 
     We currently convert a static YAML file into a Frictionless datapackage,
-    then pass that in.
+    then boil that down into a compact Catalog (see catalog.py) that we index
+    and serve the search results from.
+
+    If PUDL_VIEWER_DATAPACKAGE_PATH is set, read the datapackage from that
+    local file instead of the nightly build - useful for running offline, e.g.
+    in the load tests.
     """
-    # TODO: in the future, download this datapackage from nightly build.
-    s3_url = "https://s3.us-west-2.amazonaws.com/pudl.catalyst.coop/nightly/pudl_parquet_datapackage.json"
+    local_path = os.getenv("PUDL_VIEWER_DATAPACKAGE_PATH")
+    if local_path:
+        log.info(f"loading datapackage from {local_path}")
+        datapackage_descriptor = json.loads(Path(local_path).read_text())
+    else:
+        # TODO: in the future, download this datapackage from nightly build.
+        s3_url = "https://s3.us-west-2.amazonaws.com/pudl.catalyst.coop/nightly/pudl_parquet_datapackage.json"
 
-    log.info(f"loading datapackage from {s3_url}")
-    datapackage_descriptor = requests.get(s3_url).json()
+        log.info(f"loading datapackage from {s3_url}")
+        datapackage_descriptor = requests.get(s3_url).json()
     datapackage = clean_descriptions(Package.from_descriptor(datapackage_descriptor))
-    index = initialize_index(datapackage)
-    return datapackage, index
+    # only hold on to the compact catalog, not the whole frictionless Package.
+    catalog = build_catalog(datapackage, sort_key=sort_resources_by_name)
+    index, spelling = initialize_index(catalog)
+    return catalog, index, spelling
 
 
 def create_app():
@@ -110,6 +191,14 @@ def create_app():
     app = Flask("parquet_fe_prototype", instance_relative_config=True)
     if os.getenv("IS_CLOUD_RUN"):
         app.config["PREFERRED_URL_SCHEME"] = "https"
+    # behind a proxy (e.g. Cloud Run's front end), remote_addr is the proxy -
+    # trust this many X-Forwarded-For hops to find the real client, which we
+    # need for per-user admission control.
+    proxy_hops = int(
+        os.getenv("PUDL_VIEWER_PROXY_HOPS", 1 if os.getenv("IS_CLOUD_RUN") else 0)
+    )
+    if proxy_hops:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxy_hops)
     app.config.from_mapping(
         SECRET_KEY=os.getenv("PUDL_VIEWER_SECRET_KEY"),
         TEMPLATES_AUTO_RELOAD=True,
@@ -126,31 +215,40 @@ def create_app():
     login_manager = LoginManager()
     login_manager.init_app(app)
 
-    datapackage, index = __build_search_index(app)
-
-    def sort_resources_by_name(resource):
-        name = resource.name
-
-        # make these tables show up first, by returning negative numbers.
-        first_tables = [
-            "out_eia__monthly_generators",
-            "out_eia923__fuel_receipts_costs",
-            "out_ferc1__yearly_all_plants",
-            "out_eia__yearly_generators",
-        ]
-        if name in first_tables:
-            return first_tables.index(name) - len(first_tables) - 1
-
-        if name.startswith("out"):
-            return 0
-        if name.startswith("core"):
-            return 1
-        if name.startswith("_out"):
-            return 2
-        if name.startswith("_core"):
-            return 3
+    catalog, index, spelling = __build_search_index(app)
 
-    sorted_resources = sorted(datapackage.resources, key=sort_resources_by_name)
+    parquet_metadata = ParquetMetadataCache(
+        base=os.getenv("PUDL_VIEWER_PARQUET_BASE", NIGHTLY_PARQUET_BASE),
+        known_tables=set(catalog.by_name),
+    )
+    admission = AdmissionController()
+
+    # record every query we hand out, and warm up the metadata cache with
+    # whatever's been popular recently.
+    telemetry_path = os.getenv("PUDL_VIEWER_TELEMETRY_PATH")
+    telemetry = TelemetryWriter(telemetry_path) if telemetry_path else None
+
+    def warm_parquet_metadata():
+        try:
+            parquet_metadata.warm(hot_tables(telemetry_path))
+        except Exception as e:
+            # e.g. no telemetry yet, or someone else has the file open - this
+            # is only an optimization, so never let it take anything down.
+            log.warning("parquet_metadata_warm_failed", error=str(e))
+
+    if telemetry:
+        threading.Thread(
+            target=warm_parquet_metadata,
+            name="parquet-metadata-warmer",
+            daemon=True,
+        ).start()
+
+    dictionaries_path = os.getenv("PUDL_VIEWER_DICTIONARIES_PATH")
+    dictionaries = (
+        load_dictionaries(json.loads(Path(dictionaries_path).read_text()))
+        if dictionaries_path
+        else {}
+    )
 
     @app.get("/")
     def home():
@@ -221,19 +319,183 @@ def create_app():
         If hit as part of an HTMX request, only render the search results HTML
         fragment. Otherwise render the whole page.
 
+        Typos in the query are corrected before searching, and the corrected
+        query is passed along as a suggestion.
+
         Params:
             q: the query string
+            exact: if set, search for q as-is, without correcting typos.
         """
         template = "partials/search_results.html" if htmx else "search.html"
         query = request.args.get("q")
         log.info("search", url=request.path, query=query)
 
+        suggestion = None
         if query:
-            resources = run_search(ix=index, raw_query=query)
+            if not request.args.get("exact"):
+                suggestion = spelling.correct(query)
+            resources = run_search(
+                ix=index, raw_query=suggestion or query, catalog=catalog
+            )
         else:
-            resources = sorted_resources
+            resources = catalog.resources
 
-        return render_template(template, resources=resources, query=query)
+        return render_template(
+            template, resources=resources, query=query, suggestion=suggestion
+        )
+
+    count_cache = CountCache()
+    query_cache: LRUCache[tuple, QuerySpec] = LRUCache(max_entries=1_000)
+
+    DEFAULT_PREVIEW_PAGE = 10_000
+    DEFAULT_CSV_EXPORT_PAGE = 1_000_000
+    MAX_BATCH_PAGES = 100
+
+    def current_user_key() -> str:
+        # key anonymous users (i.e. with LOGIN_DISABLED) by address instead.
+        return current_user.get_id() or request.remote_addr
+
+    def count_key(
+        name: str, filters: list[Filter], metadata: TableMetadata
+    ) -> tuple[str, str, str, str]:
+        """Counts come from the client, so they're only ever served back to
+        whoever reported them - and only for the file they counted."""
+        table_name = name.removesuffix(".parquet")
+        return (
+            current_user_key(),
+            metadata.fingerprint,
+            table_name,
+            normalize_filters(filters),
+        )
+
+    def is_known_table(name) -> bool:
+        return (
+            isinstance(name, str)
+            and catalog.get(name.removesuffix(".parquet")) is not None
+        )
+
+    def lookup_table(name: str, filters: list[Filter]):
+        """Everything we know about a table that bears on querying it:
+        (resource, metadata, dictionary, estimated scan cost, row count)."""
+        resource = catalog.get(name.removesuffix(".parquet"))
+        metadata = parquet_metadata.get(name)
+        dictionary = dictionaries.get(name.removesuffix(".parquet"))
+        if dictionary and not (metadata and dictionary.is_current(metadata)):
+            dictionary = None
+        if metadata:
+            row_group_mask = dictionary.row_group_mask(filters) if dictionary else None
+            cost = estimate_scan_cost(metadata, filters, row_group_mask)
+        else:
+            cost = None
+
+        # if it's unfiltered the Parquet footer can tell us the count, and if
+        # this user has already counted it they don't need to again.
+        row_count = None
+        if metadata and not filters:
+            row_count = metadata.num_rows
+        elif metadata:
+            row_count = count_cache.get(count_key(name, filters, metadata))
+        return resource, metadata, dictionary, cost, row_count
+
+    def admit(name: str, cost: ScanCost | None, can_downgrade: bool) -> Decision:
+        user_key = current_user_key()
+        # a user only ever looks at one preview of a table at a time.
+        decision = admission.admit(
+            user_key,
+            cost,
+            can_downgrade=can_downgrade,
+            replaces=f"preview:{name}" if can_downgrade else None,
+        )
+        log.info(
+            "admission",
+            decision=decision.action,
+            reason=decision.reason,
+            user_key=user_key,
+            table=name,
+            est_rows=cost.rows if cost else None,
+            est_bytes=cost.bytes if cost else None,
+            tokens=round(decision.tokens, 2),
+            retry_after=decision.retry_after_s,
+        )
+        return decision
+
+    def compile_query(
+        name: str,
+        filters: list[Filter],
+        sorts: list[Sort],
+        resource: CatalogResource | None,
+        dictionary: TableDictionary | None,
+        combined: bool = False,
+    ) -> QuerySpec:
+        """ag_grid_to_duckdb, memoized on the table and normalized filters.
+
+        Returns a fresh copy each time, since callers tack LIMITs etc. on.
+        """
+        key = (
+            catalog.version,
+            name,
+            filters_hash(filters),
+            json.dumps([s.model_dump(mode="json") for s in sorts]),
+            dictionary is not None,
+            combined,
+        )
+        query = query_cache.get(key)
+        if query is None:
+            query = ag_grid_to_duckdb(
+                name=name,
+                filters=filters,
+                dictionary=dictionary,
+                sorts=sorts,
+                columns=resource.field_names if resource else [],
+                tiebreakers=list(resource.primary_key) if resource else [],
+                combined=combined,
+            )
+            query_cache.put(key, query)
+        return replace(query, values=list(query.values))
+
+    def page_event(per_page: int) -> str:
+        if per_page == DEFAULT_PREVIEW_PAGE:
+            return "duckdb_preview"
+        if per_page == DEFAULT_CSV_EXPORT_PAGE:
+            return "duckdb_csv"
+        return "duckdb_other"
+
+    def record_query(
+        event: str,
+        name: str,
+        filters: list[Filter],
+        pages: list[int],
+        per_page: int,
+        decision: Decision,
+        start: float,
+    ):
+        """One record per page handed out, with the server time split
+        between them."""
+        if telemetry:
+            ts = datetime.now(timezone.utc).replace(tzinfo=None)
+            server_ms = (time.perf_counter() - start) * 1000 / max(1, len(pages))
+            for page in pages:
+                telemetry.record(
+                    QueryRecord(
+                        ts=ts,
+                        event=event,
+                        table_name=name.removesuffix(".parquet"),
+                        filter_shape=filter_shape(filters),
+                        num_filters=len(filters),
+                        page=page,
+                        per_page=per_page,
+                        user_id=current_user.get_id(),
+                        decision=decision.action,
+                        server_ms=server_ms,
+                    )
+                )
+
+    def rejection(decision: Decision):
+        return (
+            {"error": decision.reason, "retry_after": decision.retry_after_s},
+            429,
+            {"Retry-After": str(decision.retry_after_s)},
+        )
 
     @app.get("/api/duckdb")
     def duckdb():
@@ -241,6 +503,7 @@ def create_app():
 
         Params:
             perspective_filters: a table name and its associated filters.
+            sort: AG Grid's sort model - a list of {colId, sort} objects.
             forDownload: whether this is for the full download (i.e., no row
                 limit) or a sample query which needs a limit to be fast.
 
@@ -248,27 +511,227 @@ def create_app():
             duckdb_query: prepared statements and the corresponding values to
                 both query the data and also get a full row-count of the result
                 set.
+
+        If the user is over their query budget (see admission.py), previews
+        come back as a cheap approximate preview and anything else gets a 429
+        with a Retry-After.
         """
+        start = time.perf_counter()
         name = request.args.get("name")
-        filters = [
-            Filter.model_validate(f)
-            for f in json.loads(request.args.get("filters", "[]"))
-        ]
-        duckdb_query = ag_grid_to_duckdb(name=name, filters=filters)
+        if not is_known_table(name):
+            return {"error": f"unknown table {name}"}, 400
+        try:
+            filters = [
+                Filter.model_validate(f)
+                for f in json.loads(request.args.get("filters", "[]"))
+            ]
+            sorts = [
+                Sort.model_validate(s)
+                for s in json.loads(request.args.get("sort", "[]"))
+            ]
+        except (TypeError, ValueError) as e:
+            return {"error": str(e)}, 400
         page = int(request.args.get("page", 1))
-        DEFAULT_PREVIEW_PAGE = 10_000
-        DEFAULT_CSV_EXPORT_PAGE = 1_000_000
         per_page = int(request.args.get("perPage", DEFAULT_PREVIEW_PAGE))
-        if per_page == DEFAULT_PREVIEW_PAGE:
-            event = "duckdb_preview"
-        elif per_page == DEFAULT_CSV_EXPORT_PAGE:
-            event = "duckdb_csv"
+        event = page_event(per_page)
+
+        log.info(
+            event,
+            url=request.path,
+            params=dict(request.args),
+            user_id=current_user.get_id(),
+        )
+
+        resource, _, dictionary, cost, row_count = lookup_table(name, filters)
+        # compile before charging anyone, so that bad requests are free.
+        try:
+            duckdb_query = compile_query(name, filters, sorts, resource, dictionary)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        decision = admit(name, cost, can_downgrade=event == "duckdb_preview")
+
+        # otherwise, if not many rows can match, count them in the same scan
+        # as the preview. Not if it's sorted, though - the window function
+        # would stop DuckDB from using top-N for the ORDER BY.
+        COMBINED_MAX_ROWS = 1_000_000
+        combined = (
+            event == "duckdb_preview"
+            and decision.action == ALLOW
+            and row_count is None
+            and not sorts
+            and cost is not None
+            and cost.rows <= COMBINED_MAX_ROWS
+        )
+        if combined:
+            duckdb_query = compile_query(
+                name, filters, sorts, resource, dictionary, combined=True
+            )
+        if duckdb_query.row_count is None:
+            duckdb_query.row_count = row_count
+
+        if decision.action == REJECT:
+            response = rejection(decision)
+        elif decision.action == DOWNGRADE:
+            APPROXIMATE_PREVIEW_ROWS = 1_000
+            if duckdb_query.row_count is None and cost:
+                duckdb_query.row_count = cost.rows
+            response = asdict(
+                approximate_preview(duckdb_query, limit=APPROXIMATE_PREVIEW_ROWS)
+            )
         else:
-            event = "duckdb_other"
+            offset = (page - 1) * per_page
+            duckdb_query.statement += f" LIMIT {per_page} OFFSET {offset}"
+            response = asdict(duckdb_query)
+
+        record_query(event, name, filters, [page], per_page, decision, start)
+        return response
 
-        log.info(event, url=request.path, params=dict(request.args))
-        offset = (page - 1) * per_page
-        duckdb_query.statement += f" LIMIT {per_page} OFFSET {offset}"
-        return asdict(duckdb_query)
+    @app.post("/api/duckdb/batch")
+    def duckdb_batch():
+        """Compile a whole run of pages in one go - e.g. every page of a CSV
+        export, or the next few preview pages to prefetch.
+
+        Filters and sort are validated and compiled once, and the result is
+        paged.
+
+        Params (JSON body):
+            name: the table name.
+            filters: AG Grid filters, as for /api/duckdb.
+            sort: AG Grid's sort model, as for /api/duckdb.
+            perPage: rows per page.
+            pages: which pages to compile. If left out, firstPage (default 1)
+                to lastPage; if that's left out too, every page of rowCount
+                rows - or of the row count we know about, if we know one, or
+                failing that of our upper-bound estimate. In that last case
+                the trailing pages may well be empty.
+            prefetch: how many more pages to compile after those.
+
+        Returns:
+            queries: one QuerySpec per page.
+            pages: the page number of each QuerySpec.
+
+        Batches aren't downgraded - if the user is over budget they get a
+        429 with a Retry-After, like CSV exports do.
+        """
+        start = time.perf_counter()
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict) or "name" not in body:
+            return {"error": "expected a JSON object with a table name"}, 400
+        name = body["name"]
+        if not is_known_table(name):
+            return {"error": f"unknown table {name}"}, 400
+        log.info(
+            "duckdb_batch",
+            url=request.path,
+            params=body,
+            user_id=current_user.get_id(),
+        )
+        try:
+            filters = [Filter.model_validate(f) for f in body.get("filters", [])]
+            sorts = [Sort.model_validate(s) for s in body.get("sort", [])]
+            per_page = int(body.get("perPage", DEFAULT_CSV_EXPORT_PAGE))
+            prefetch = int(body.get("prefetch", 0))
+            if per_page < 1 or prefetch < 0:
+                raise ValueError("perPage must be positive and prefetch non-negative")
+        except (TypeError, ValueError) as e:
+            return {"error": str(e)}, 400
+
+        resource, _, dictionary, cost, row_count = lookup_table(name, filters)
+        # an estimate's only an upper bound, so the last few pages may be empty.
+        max_rows = row_count if row_count is not None or cost is None else cost.rows
+        try:
+            pages = page_range(
+                per_page,
+                pages=body.get("pages"),
+                first_page=body.get("firstPage"),
+                last_page=body.get("lastPage"),
+                row_count=body.get("rowCount", max_rows),
+                prefetch=prefetch,
+                max_pages=MAX_BATCH_PAGES,
+            )
+        except (TypeError, ValueError) as e:
+            return {"error": str(e)}, 400
+
+        try:
+            duckdb_query = compile_query(name, filters, sorts, resource, dictionary)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        if duckdb_query.row_count is None:
+            duckdb_query.row_count = row_count
+
+        # each page is its own scan, so charge for all of them up front.
+        batch_cost = (
+            replace(cost, bytes=cost.bytes * len(pages)) if cost and pages else cost
+        )
+        decision = admit(name, batch_cost, can_downgrade=False)
+        if decision.action != ALLOW:
+            response = rejection(decision)
+        else:
+            response = {
+                "queries": [
+                    asdict(
+                        replace(
+                            duckdb_query,
+                            statement=duckdb_query.statement
+                            + f" LIMIT {per_page} OFFSET {(page - 1) * per_page}",
+                        )
+                    )
+                    for page in pages
+                ],
+                "pages": pages,
+            }
+
+        # record each page as if it had been asked for on its own, so that
+        # e.g. CSV export pages are counted the same either way. A rejected
+        # batch is only one request, though.
+        record_query(
+            page_event(per_page),
+            name,
+            filters,
+            pages if decision.action == ALLOW else pages[:1],
+            per_page,
+            decision,
+            start,
+        )
+        return response
+
+    @app.post("/api/duckdb/count")
+    def duckdb_count():
+        """Let the frontend tell us a row count it worked out, so that it
+        doesn't have to count the same rows again.
+
+        Counts are only remembered for the user that reported them - we can't
+        check them, so we can't share them.
+
+        Params (JSON body):
+            name: the table name.
+            filters: the filters that were counted.
+            count: how many rows matched.
+        """
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict) or "name" not in body:
+            return {"error": "expected a JSON object with a table name"}, 400
+        name = body["name"]
+        if not is_known_table(name):
+            return {"error": f"unknown table {name}"}, 400
+        try:
+            filters = [Filter.model_validate(f) for f in body.get("filters", [])]
+        except (TypeError, ValueError) as e:
+            return {"error": str(e)}, 400
+        count = body.get("count")
+        if isinstance(count, bool) or not isinstance(count, int) or count < 0:
+            return {"error": "count must be a non-negative integer"}, 400
+
+        # only take counts that are plausible given what's in the file.
+        metadata = parquet_metadata.get(name)
+        if metadata is None:
+            return {"error": f"no metadata for {name}"}, 400
+        if count > estimate_scan_cost(metadata, filters).rows:
+            return {"error": "count is more than the table could contain"}, 400
+
+        # unfiltered counts come from the footer - nothing to remember.
+        if filters:
+            count_cache.put(count_key(name, filters, metadata), count)
+        return "", 204
 
     return app
@@ -0,0 +1,170 @@
+"""Per-user admission control for /api/duckdb.
+
+The queries themselves run in the browser, but each QuerySpec we hand out sends
+that browser off to scan our Parquet files - so this is where we decide whether
+a user gets to start another big scan right now.
+
+Each user gets:
+
+* a token bucket, which is charged in proportion to the estimated bytes a
+  query scans;
+* a handful of concurrency slots. Since we never hear back when the browser is
+  done, a slot is leased for roughly as long as we expect the scan to take -
+  or until the same user asks for another preview of the same table, since
+  the grid drops the old one as soon as the filters or sort change.
+
+When either is exhausted, previews are downgraded to a cheap approximate
+preview and everything else is rejected with a Retry-After.
+"""
+
+import math
+import threading
+import time
+from dataclasses import dataclass, field
+
+from parquet_fe_prototype.parquet_metadata import ScanCost
+
+ALLOW = "allow"
+DOWNGRADE = "downgrade"
+REJECT = "reject"
+
+
+@dataclass
+class TokenBucket:
+    """Classic token bucket - refills continuously up to capacity."""
+
+    capacity: float
+    refill_per_s: float
+    tokens: float | None = None
+    updated_at: float | None = None
+
+    def __post_init__(self):
+        if self.tokens is None:
+            self.tokens = self.capacity
+
+    def _refill(self, now: float):
+        if self.updated_at is not None:
+            elapsed = max(0.0, now - self.updated_at)
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_s)
+        self.updated_at = now
+
+    def wait_time(self, cost: float, now: float) -> float:
+        """How long until cost tokens are available - 0 if they are now."""
+        self._refill(now)
+        # anything more expensive than a full bucket just has to wait for one.
+        cost = min(cost, self.capacity)
+        if self.tokens >= cost:
+            return 0.0
+        return (cost - self.tokens) / self.refill_per_s
+
+    def take(self, cost: float, now: float):
+        self._refill(now)
+        self.tokens -= min(cost, self.capacity)
+
+
+@dataclass
+class _UserBudget:
+    bucket: TokenBucket
+    # (expires at, key) - see AdmissionController.admit.
+    leases: list[tuple[float, str | None]] = field(default_factory=list)
+
+
+@dataclass(frozen=True)
+class Decision:
+    action: str
+    tokens: float
+    lease_s: float
+    retry_after_s: int = 0
+    reason: str | None = None
+
+
+class AdmissionController:
+    """Decide whether a user's query may run.
+
+    Params:
+        capacity: size of each user's token bucket.
+        refill_per_s: tokens regained per second.
+        max_concurrent: number of scans a user can have in flight.
+        bytes_per_token: how many scanned bytes one token pays for. Every
+            query costs at least one token.
+        scan_bytes_per_s: assumed client scan throughput, used to guess how
+            long a concurrency slot stays busy.
+        min_lease_s: shortest time a slot is held for.
+    """
+
+    def __init__(
+        self,
+        capacity: float = 50,
+        refill_per_s: float = 0.5,
+        max_concurrent: int = 2,
+        bytes_per_token: int = 50_000_000,
+        scan_bytes_per_s: int = 25_000_000,
+        min_lease_s: float = 1.0,
+    ):
+        self.capacity = capacity
+        self.refill_per_s = refill_per_s
+        self.max_concurrent = max_concurrent
+        self.bytes_per_token = bytes_per_token
+        self.scan_bytes_per_s = scan_bytes_per_s
+        self.min_lease_s = min_lease_s
+        self._budgets: dict[str, _UserBudget] = {}
+        self._lock = threading.Lock()
+
+    def price(self, cost: ScanCost | None) -> tuple[float, float]:
+        """Turn an estimated scan cost into (tokens, lease seconds).
+
+        If we couldn't estimate the cost, charge the minimum.
+        """
+        if cost is None:
+            return 1.0, self.min_lease_s
+        tokens = 1.0 + cost.bytes / self.bytes_per_token
+        lease_s = max(self.min_lease_s, cost.bytes / self.scan_bytes_per_s)
+        return tokens, lease_s
+
+    def admit(
+        self,
+        user_key: str,
+        cost: ScanCost | None,
+        can_downgrade: bool,
+        now: float | None = None,
+        replaces: str | None = None,
+    ) -> Decision:
+        """Charge the user for a query, or tell them to back off.
+
+        Downgraded queries aren't charged - they're cheap by construction.
+
+        If replaces is set, any scan this user still has leased under the same
+        key is taken to be abandoned, and its slot freed for this one. The
+        tokens it cost aren't refunded.
+        """
+        now = time.monotonic() if now is None else now
+        tokens, lease_s = self.price(cost)
+        with self._lock:
+            budget = self._budgets.setdefault(
+                user_key,
+                _UserBudget(bucket=TokenBucket(self.capacity, self.refill_per_s)),
+            )
+            budget.leases = [
+                (expires_at, key)
+                for expires_at, key in budget.leases
+                if expires_at > now and (replaces is None or key != replaces)
+            ]
+
+            wait_s = budget.bucket.wait_time(tokens, now)
+            reason = "rate_limited" if wait_s else None
+            if len(budget.leases) >= self.max_concurrent:
+                reason = "too_many_concurrent"
+                wait_s = max(wait_s, min(budget.leases)[0] - now)
+
+            if reason is None:
+                budget.bucket.take(tokens, now)
+                budget.leases.append((now + lease_s, replaces))
+                return Decision(action=ALLOW, tokens=tokens, lease_s=lease_s)
+
+        return Decision(
+            action=DOWNGRADE if can_downgrade else REJECT,
+            tokens=tokens,
+            lease_s=lease_s,
+            retry_after_s=max(1, math.ceil(wait_s)),
+            reason=reason,
+        )
@@ -0,0 +1,115 @@
+"""A compact, read-only view of the datapackage.
+
+The frictionless Package is a heavy thing to keep around in every worker:
+each Resource and Field is a full object with its own dict, and the
+descriptions - cleaned into HTML - are repeated across every table that shares
+a column. All the app actually needs from it is names, descriptions, column
+names and primary keys, so we pull those out once at startup into slotted,
+frozen records and let the Package go.
+
+* Names are interned, since the same column names show up across dozens of
+  tables.
+* Descriptions are deduplicated through a shared StringTable, so e.g. the
+  description of ``plant_id_eia`` is held once no matter how many tables
+  have that column.
+"""
+
+import hashlib
+import json
+import sys
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+
+from frictionless import Package
+
+
+class StringTable:
+    """Hand out one shared copy of each distinct string."""
+
+    __slots__ = ("_strings",)
+
+    def __init__(self):
+        self._strings: dict[str, str] = {}
+
+    def add(self, string: str | None) -> str:
+        string = string or ""
+        return self._strings.setdefault(string, string)
+
+    def __len__(self) -> int:
+        return len(self._strings)
+
+
+@dataclass(frozen=True, slots=True)
+class CatalogField:
+    name: str
+    description: str
+
+
+@dataclass(frozen=True, slots=True)
+class CatalogResource:
+    name: str
+    description: str
+    fields: tuple[CatalogField, ...]
+    primary_key: tuple[str, ...]
+
+    @property
+    def field_names(self) -> list[str]:
+        return [f.name for f in self.fields]
+
+
+@dataclass(frozen=True, slots=True)
+class Catalog:
+    """Every resource in the datapackage, in display order.
+
+    version identifies the datapackage the catalog was built from, so that
+    anything cached against it can tell when it's out of date.
+    """
+
+    version: str
+    resources: tuple[CatalogResource, ...]
+    by_name: dict[str, CatalogResource]
+
+    def get(self, name: str) -> CatalogResource | None:
+        return self.by_name.get(name)
+
+    def __iter__(self) -> Iterator[CatalogResource]:
+        return iter(self.resources)
+
+    def __len__(self) -> int:
+        return len(self.resources)
+
+
+def build_catalog(
+    datapackage: Package,
+    sort_key: Callable[[CatalogResource], int] | None = None,
+) -> Catalog:
+    """Pull what we need out of a (cleaned) datapackage.
+
+    Resources are ordered by sort_key, if given.
+    """
+    strings = StringTable()
+    resources = [
+        CatalogResource(
+            name=sys.intern(resource.name),
+            description=strings.add(resource.description),
+            fields=tuple(
+                CatalogField(
+                    name=sys.intern(field.name),
+                    description=strings.add(field.description),
+                )
+                for field in resource.schema.fields
+            ),
+            primary_key=tuple(sys.intern(k) for k in resource.schema.primary_key),
+        )
+        for resource in datapackage.resources
+    ]
+    if sort_key is not None:
+        resources.sort(key=sort_key)
+    version = hashlib.sha256(
+        json.dumps(datapackage.to_descriptor(), sort_keys=True).encode()
+    ).hexdigest()[:16]
+    return Catalog(
+        version=version,
+        resources=tuple(resources),
+        by_name={resource.name: resource for resource in resources},
+    )
@@ -0,0 +1,74 @@
+"""Remember how many rows each filtered table has.
+
+Every preview needs the total number of matching rows, which normally means
+a second full scan of the filtered table. But that number only depends on the
+table, the filters, and the data - not on the page or the sort order - so once
+someone has counted it, they don't need to again.
+
+The same goes for compiling the filters into SQL in the first place, so the
+LRU here is also used to remember compiled queries.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Generic, TypeVar
+
+from parquet_fe_prototype.duckdb_query import Filter
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+
+def normalize_filters(filters: list[Filter]) -> str:
+    """A canonical string for a set of filters.
+
+    Filter order and the casing of the operation don't change the result, so
+    they don't change this either.
+    """
+    normalized = [
+        {**f.model_dump(mode="json"), "operation": f.operation.lower()}
+        for f in filters
+    ]
+    return json.dumps(
+        sorted(normalized, key=lambda f: json.dumps(f, sort_keys=True)),
+        sort_keys=True,
+    )
+
+
+def filters_hash(filters: list[Filter]) -> str:
+    """Short, stable hash of normalize_filters - for keys that get kept
+    around a lot."""
+    return hashlib.sha256(normalize_filters(filters).encode()).hexdigest()[:16]
+
+
+class LRUCache(Generic[K, V]):
+    """Thread-safe least-recently-used cache."""
+
+    def __init__(self, max_entries: int = 10_000):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[K, V] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: K) -> V | None:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: K, value: V):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class CountCache(LRUCache[tuple[str, str, str, str], int]):
+    """Row counts, keyed by (user, footer fingerprint, table, normalized
+    filters)."""
@@ -0,0 +1,239 @@
+"""Value dictionaries for low-cardinality columns.
+
+Lots of PUDL columns are codes - states, fuel types, prime movers, report
+years - with a handful of distinct values. If we know every value a column
+takes, and which row groups each value shows up in, we can resolve an
+``equals`` or ``contains`` filter on the server:
+
+* to the exact values it matches, so a ``contains`` becomes an ``IN`` list
+  instead of an ``ILIKE`` scan;
+* to the row groups that can possibly match, for cost estimation;
+* or to nothing at all, in which case we know the answer is zero rows without
+  anyone scanning anything.
+
+Dictionaries are built offline after each nightly build:
+
+    $ python -m parquet_fe_prototype.dictionaries --parquet-dir ./nightly --out dictionaries.json
+
+and loaded by the app from ``PUDL_VIEWER_DICTIONARIES_PATH``.
+"""
+
+import argparse
+import json
+from dataclasses import dataclass
+from pathlib import Path
+
+import duckdb
+
+from parquet_fe_prototype.duckdb_query import Filter
+from parquet_fe_prototype.parquet_metadata import TableMetadata, read_table_metadata
+
+DEFAULT_MAX_CARDINALITY = 512
+TEXT_TYPES = {"VARCHAR"}
+NUMBER_TYPES = {"TINYINT", "SMALLINT", "INTEGER", "BIGINT"}
+
+
+@dataclass(frozen=True)
+class ColumnDictionary:
+    """Every value in a column, and a bitmap of the row groups it's in.
+
+    kind is the AG Grid filter type this column is filtered with - "text" or
+    "number".
+    """
+
+    kind: str
+    values: dict[str | int, int]
+
+    def lookup(self, filter: Filter) -> list | None:
+        """Exact values matching a filter, or None if we can't tell.
+
+        Matching is case-insensitive, like the frontend's collation.
+        """
+        if filter.field_type != self.kind or filter.value is None:
+            return None
+        op = filter.operation.lower()
+        if self.kind == "number":
+            if op != "equals":
+                return None
+            try:
+                target = float(filter.value)
+            except (TypeError, ValueError):
+                return None
+            return [v for v in self.values if v == target]
+
+        target = str(filter.value).lower()
+        if op == "equals":
+            return [v for v in self.values if v.lower() == target]
+        if op == "contains":
+            return [v for v in self.values if target in v.lower()]
+        return None
+
+    def row_groups(self, values: list) -> int:
+        """Bitmap of the row groups containing any of values."""
+        bitmap = 0
+        for value in values:
+            bitmap |= self.values[value]
+        return bitmap
+
+
+@dataclass(frozen=True)
+class TableDictionary:
+    """Dictionaries for one table's low-cardinality columns.
+
+    fingerprint is the footer fingerprint (see TableMetadata) of the Parquet
+    file we built these from - if the file has changed since then, they're
+    stale and mustn't be used. A missing value can't match anything.
+    """
+
+    fingerprint: str | None
+    columns: dict[str, ColumnDictionary]
+
+    def is_current(self, metadata: TableMetadata) -> bool:
+        """Were these dictionaries built from the file metadata describes?"""
+        return self.fingerprint is not None and self.fingerprint == metadata.fingerprint
+
+    def row_group_mask(self, filters: list[Filter]) -> int | None:
+        """Bitmap of row groups that could match all filters, or None if the
+        dictionaries don't narrow things down at all."""
+        mask = None
+        for filter in filters:
+            column = self.columns.get(filter.field_name)
+            if column is None:
+                continue
+            values = column.lookup(filter)
+            if values is None:
+                continue
+            bitmap = column.row_groups(values)
+            mask = bitmap if mask is None else mask & bitmap
+        return mask
+
+
+def build_table_dictionary(
+    path: Path, max_cardinality: int = DEFAULT_MAX_CARDINALITY
+) -> TableDictionary:
+    """Scan a Parquet file and build dictionaries for its low-cardinality
+    text/integer columns."""
+    con = duckdb.connect(":memory:")
+    con.execute(
+        """
+        CREATE TEMP TABLE row_groups AS
+        SELECT
+            row_group_id,
+            SUM(row_group_num_rows) OVER (ORDER BY row_group_id)
+                - row_group_num_rows AS first_row
+        FROM (
+            SELECT DISTINCT row_group_id, row_group_num_rows
+            FROM parquet_metadata(?)
+        )
+        """,
+        [str(path)],
+    )
+    fingerprint = read_table_metadata(str(path), path.stem).fingerprint
+    # views can't take prepared parameters, so quote the path ourselves.
+    quoted_path = "'" + str(path).replace("'", "''") + "'"
+    con.execute(
+        f"""
+        CREATE TEMP VIEW rows AS
+        SELECT * FROM read_parquet({quoted_path}, file_row_number = true)
+        """
+    )
+
+    columns = {}
+    for name, type_, *_ in con.execute("DESCRIBE rows").fetchall():
+        # that's ours, not the table's.
+        if name == "file_row_number":
+            continue
+        if type_ in TEXT_TYPES:
+            kind = "text"
+        elif type_ in NUMBER_TYPES:
+            kind = "number"
+        else:
+            continue
+        quoted = '"' + name.replace('"', '""') + '"'
+        cardinality = con.execute(
+            f"SELECT approx_count_distinct({quoted}) FROM rows"
+        ).fetchone()[0]
+        # approx_count_distinct can undershoot a little, so double-check below.
+        if cardinality > max_cardinality * 1.1:
+            continue
+        value_row_groups = con.execute(
+            f"""
+            SELECT {quoted}, LIST(DISTINCT row_groups.row_group_id)
+            FROM rows ASOF JOIN row_groups
+                ON rows.file_row_number >= row_groups.first_row
+            WHERE {quoted} IS NOT NULL
+            GROUP BY {quoted}
+            """
+        ).fetchall()
+        if len(value_row_groups) > max_cardinality:
+            continue
+        columns[name] = ColumnDictionary(
+            kind=kind,
+            values={
+                value: sum(1 << rg for rg in rgs) for value, rgs in value_row_groups
+            },
+        )
+    return TableDictionary(fingerprint=fingerprint, columns=columns)
+
+
+def dump_dictionaries(dictionaries: dict[str, TableDictionary]) -> dict:
+    """Serialize to JSON-friendly data - bitmaps as hex strings."""
+    return {
+        table_name: {
+            "fingerprint": table.fingerprint,
+            "columns": {
+                name: {
+                    "kind": column.kind,
+                    "values": [[v, hex(bitmap)] for v, bitmap in column.values.items()],
+                }
+                for name, column in table.columns.items()
+            },
+        }
+        for table_name, table in dictionaries.items()
+    }
+
+
+def load_dictionaries(data: dict) -> dict[str, TableDictionary]:
+    """Inverse of dump_dictionaries."""
+    return {
+        table_name: TableDictionary(
+            # dictionaries from before we had fingerprints are never current.
+            fingerprint=table.get("fingerprint"),
+            columns={
+                name: ColumnDictionary(
+                    kind=column["kind"],
+                    values={v: int(bitmap, 16) for v, bitmap in column["values"]},
+                )
+                for name, column in table["columns"].items()
+            },
+        )
+        for table_name, table in data.items()
+    }
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--parquet-dir",
+        type=Path,
+        required=True,
+        help="Directory of <table_name>.parquet files, e.g. a copy of the nightly build.",
+    )
+    parser.add_argument("--out", type=Path, required=True)
+    parser.add_argument(
+        "--max-cardinality",
+        type=int,
+        default=DEFAULT_MAX_CARDINALITY,
+        help="Skip columns with more distinct values than this.",
+    )
+    args = parser.parse_args(argv)
+
+    dictionaries = {
+        path.stem: build_table_dictionary(path, args.max_cardinality)
+        for path in sorted(args.parquet_dir.glob("*.parquet"))
+    }
+    args.out.write_text(json.dumps(dump_dictionaries(dictionaries)))
+
+
+if __name__ == "__main__":
+    main()
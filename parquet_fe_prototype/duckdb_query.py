@@ -1,10 +1,16 @@
 """Generate DuckDB queries."""
 
 from dataclasses import dataclass
-import itertools
+from typing import TYPE_CHECKING, Literal
 
 from pydantic import BaseModel
 
+if TYPE_CHECKING:
+    from parquet_fe_prototype.dictionaries import TableDictionary
+
+# in combined mode, the total row count comes back in this column.
+TOTAL_ROWS_COLUMN = "__total_rows"
+
 
 def _camelize(string: str) -> str:
     """snake_case to camelCase."""
@@ -28,18 +34,46 @@ class Filter(BaseModel):
         populate_by_name = True
 
 
+class Sort(BaseModel):
+    """One entry in AG Grid's sort model."""
+
+    col_id: str
+    sort: Literal["asc", "desc"]
+
+    class Config:
+        alias_generator = _camelize
+        populate_by_name = True
+
+
 @dataclass
 class QuerySpec:
     """Description of a query we should execute on the frontend. Includes a
-    separate statement to just get the counts."""
+    separate statement to just get the counts.
+
+    If row_count is already known, the frontend can skip count_statement. If
+    combined is set, statement also returns the total count in its
+    TOTAL_ROWS_COLUMN column, so count_statement isn't needed either. If
+    approximate is set, both the rows and the count are only a sample/estimate.
+    """
 
     statement: str
     count_statement: str
     values: list
+    row_count: int | None = None
+    combined: bool = False
+    approximate: bool = False
+
+
+def __ag_filters_to_where(
+    filters: list[Filter], dictionary: "TableDictionary | None" = None
+) -> tuple[str, list, bool]:
+    """Convert FilterRules to a WHERE clause.
 
+    If we have value dictionaries for this table, filters on dictionary
+    columns get resolved to an IN list of the exact values they match.
 
-def __ag_filters_to_where(filters: list[Filter]) -> tuple[str, list]:
-    """Convert FilterRules to a WHERE clause."""
+    Also returns whether we already know that nothing matches.
+    """
     placeholder_casts = {"date": "?::DATE", "datetime": "epoch_ms(?::BIGINT)"}
     clause_templates = {
         "equals": "{col} = {placeholder}",
@@ -59,27 +93,149 @@ def __ag_filters_to_where(filters: list[Filter]) -> tuple[str, list]:
     }
 
     where_clauses = ["true"]
+    vals = []
+    known_empty = False
     for filter in filters:
         placeholder = placeholder_casts.get(filter.field_type, "?")
         col = filter.field_name
         op = filter.operation.lower()
 
+        column_dictionary = dictionary.columns.get(col) if dictionary else None
+        known_values = column_dictionary.lookup(filter) if column_dictionary else None
+        if known_values == []:
+            where_clauses.append("false")
+            known_empty = True
+            continue
+        if known_values is not None:
+            placeholders = ", ".join("?" for _ in known_values)
+            where_clauses.append(f"{col} IN ({placeholders})")
+            vals.extend(known_values)
+            continue
+
         clause_template = clause_templates.get(op, clause_templates["default"])
         where_clauses.append(
             clause_template.format(col=col, op=op, placeholder=placeholder)
         )
-
-    possible_vals = itertools.chain.from_iterable(
-        (f.value, f.value_to) for f in filters
+        vals.extend(v for v in (filter.value, filter.value_to) if v is not None)
+
+    return " AND ".join(where_clauses), vals, known_empty
+
+
+def __ag_sorts_to_order_by(
+    sorts: list[Sort], columns: list[str], tiebreakers: list[str]
+) -> str:
+    """Convert AG Grid's sort model to an ORDER BY clause.
+
+    Sort columns are checked against the table's actual columns since they
+    get interpolated straight into the SQL. Any tiebreakers (i.e. the primary
+    key) not already sorted on are added at the end, so that pages of a sorted
+    result don't overlap or skip rows.
+    """
+    unknown = [s.col_id for s in sorts if s.col_id not in columns]
+    if unknown:
+        raise ValueError(f"Can't sort on unknown columns: {unknown}")
+
+    def quote(col: str) -> str:
+        return '"' + col.replace('"', '""') + '"'
+
+    order_by = [f"{quote(s.col_id)} {s.sort.upper()} NULLS LAST" for s in sorts]
+    sorted_cols = {s.col_id for s in sorts}
+    order_by += [
+        f"{quote(col)} ASC"
+        for col in tiebreakers
+        if col in columns and col not in sorted_cols
+    ]
+    return ", ".join(order_by)
+
+
+def ag_grid_to_duckdb(
+    name: str,
+    filters: list[Filter],
+    dictionary: "TableDictionary | None" = None,
+    sorts: list[Sort] | None = None,
+    columns: list[str] | None = None,
+    tiebreakers: list[str] | None = None,
+    combined: bool = False,
+) -> QuerySpec:
+    """Turn tabulator filters into a set of DuckDB queries for the frontend to run.
+
+    If there's a sort, columns must be the table's columns. Once a LIMIT is
+    tacked on, the ORDER BY lets DuckDB use its top-N operator, which keeps
+    only the best LIMIT + OFFSET rows in a heap instead of sorting everything.
+
+    If combined is set, the page and the total count come back from a single
+    scan, via a window function. That does mean DuckDB has to hold on to every
+    matching row until it's counted them all (no top-N), so it's only a win
+    when not that many rows match.
+    """
+    where, vals, known_empty = __ag_filters_to_where(filters, dictionary)
+    if combined:
+        query = f"SELECT *, COUNT(*) OVER () AS {TOTAL_ROWS_COLUMN} FROM {name} WHERE {where}"
+    else:
+        query = f"SELECT * FROM {name} WHERE {where}"
+    if sorts:
+        order_by = __ag_sorts_to_order_by(sorts, columns or [], tiebreakers or [])
+        query += f" ORDER BY {order_by}"
+    count_query = f"SELECT COUNT(*) FROM {name} WHERE {where} LIMIT 1"
+    return QuerySpec(
+        statement=query,
+        count_statement=count_query,
+        values=vals,
+        row_count=0 if known_empty else None,
+        combined=combined,
     )
-    vals = [v for v in possible_vals if v is not None]
 
-    return " AND ".join(where_clauses), vals
+
+def approximate_preview(query: QuerySpec, limit: int) -> QuerySpec:
+    """Cheap stand-in for a preview: just the first few rows. Pair it with a
+    row count we already know or have estimated, so there's no count scan."""
+    return QuerySpec(
+        statement=f"{query.statement} LIMIT {limit}",
+        count_statement=query.count_statement,
+        values=query.values,
+        row_count=query.row_count,
+        combined=query.combined,
+        approximate=True,
+    )
 
 
-def ag_grid_to_duckdb(name: str, filters: list[Filter]) -> QuerySpec:
-    """Turn tabulator filters into a set of DuckDB queries for the frontend to run."""
-    where, vals = __ag_filters_to_where(filters)
-    query = f"SELECT * FROM {name} WHERE {where}"
-    count_query = f"SELECT COUNT(*) FROM {name} WHERE {where} LIMIT 1"
-    return QuerySpec(statement=query, count_statement=count_query, values=vals)
+def page_range(
+    per_page: int,
+    pages: list[int] | None = None,
+    first_page: int | None = None,
+    last_page: int | None = None,
+    row_count: int | None = None,
+    prefetch: int = 0,
+    max_pages: int | None = None,
+) -> list[int]:
+    """Which (1-indexed) pages a batch covers.
+
+    Explicit pages win; then first_page to last_page; then every page of
+    row_count rows - at least one, even if nothing matches. prefetch more
+    pages are tacked on after the last.
+
+    Raises ValueError if that's more than max_pages.
+    """
+    if pages is not None:
+        pages = [int(page) for page in pages]
+        first_page = min(pages, default=1)
+        last_page = max(pages, default=0)
+    else:
+        first_page = 1 if first_page is None else int(first_page)
+        if last_page is None:
+            if row_count is None:
+                raise ValueError("need pages, lastPage or rowCount")
+            last_page = max(1, -(-int(row_count) // per_page))
+        last_page = int(last_page)
+    if first_page < 1:
+        raise ValueError("pages start at 1")
+    if last_page < first_page:
+        prefetch = 0
+    num_pages = (
+        len(pages) if pages is not None else max(0, last_page - first_page + 1)
+    ) + prefetch
+    if max_pages is not None and num_pages > max_pages:
+        raise ValueError(f"at most {max_pages} pages per batch")
+    if pages is None:
+        pages = list(range(first_page, last_page + 1))
+    return pages + list(range(last_page + 1, last_page + 1 + prefetch))
@@ -0,0 +1,523 @@
+"""Replay captured traffic against the app to measure capacity.
+
+We log every search and every /api/duckdb call as a JSON line through
+structlog. This module turns those lines back into requests and fires them at
+``create_app()`` - either verbatim, or as a synthetic mix sampled from the log -
+at a configurable concurrency and arrival rate.
+
+Everything runs locally: login is disabled, the datapackage is a stub generated
+from a directory of Parquet files, and the QuerySpecs the server hands back are
+optionally executed against those same local files, standing in for the
+duckdb-wasm client.
+
+    $ python -m parquet_fe_prototype.loadtest --log app.log --parquet-dir ./parquet \\
+        --synthetic 500 --concurrency 8 --rate 50
+"""
+
+import argparse
+import gc
+import json
+import math
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+import duckdb
+import structlog
+
+from parquet_fe_prototype import create_app
+
+REPLAYABLE_EVENTS = {
+    "search",
+    "duckdb_preview",
+    "duckdb_csv",
+    "duckdb_other",
+    "duckdb_batch",
+}
+# these were POSTed as JSON, rather than sent as query parameters.
+POST_EVENTS = {"duckdb_batch"}
+
+DUCKDB_TO_FRICTIONLESS_TYPES = {
+    "BOOLEAN": "boolean",
+    "TINYINT": "integer",
+    "SMALLINT": "integer",
+    "INTEGER": "integer",
+    "BIGINT": "integer",
+    "FLOAT": "number",
+    "DOUBLE": "number",
+    "DATE": "date",
+    "TIMESTAMP": "datetime",
+    "TIMESTAMP WITH TIME ZONE": "datetime",
+}
+
+
+@dataclass
+class LoggedRequest:
+    """One request reconstructed from a log line."""
+
+    event: str
+    path: str
+    params: dict
+    timestamp: str | None = None
+    user_id: str | None = None
+
+
+@dataclass
+class Sample:
+    """Outcome of one replayed request (or one local query execution)."""
+
+    endpoint: str
+    latency_s: float
+    ok: bool
+
+
+@dataclass
+class EndpointStats:
+    """Latency and error summary for one endpoint."""
+
+    count: int
+    errors: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+
+
+@dataclass
+class Report:
+    """Summary of a whole load test run."""
+
+    requests: int
+    duration_s: float
+    throughput_rps: float
+    error_rate: float
+    baseline_rss_mb: float
+    startup_rss_mb: float
+    peak_rss_mb: float
+    endpoints: dict[str, EndpointStats] = field(default_factory=dict)
+
+    def to_text(self) -> str:
+        lines = [
+            f"{self.requests} requests in {self.duration_s:.2f}s "
+            f"({self.throughput_rps:.1f} req/s), "
+            f"error rate {self.error_rate:.2%}, "
+            f"RSS {self.baseline_rss_mb:.1f} MB before startup, "
+            f"{self.startup_rss_mb:.1f} MB after, "
+            f"{self.peak_rss_mb:.1f} MB peak",
+            f"{'endpoint':<24}{'count':>8}{'errors':>8}"
+            f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}",
+        ]
+        for name, stats in sorted(self.endpoints.items()):
+            lines.append(
+                f"{name:<24}{stats.count:>8}{stats.errors:>8}"
+                f"{stats.p50_ms:>10.2f}{stats.p95_ms:>10.2f}{stats.p99_ms:>10.2f}"
+            )
+        return "\n".join(lines)
+
+
+def read_event_log(lines) -> list[LoggedRequest]:
+    """Pull replayable requests out of structlog JSON lines.
+
+    Anything that isn't JSON, or isn't a search/duckdb event, is skipped - so
+    you can feed in a raw container log.
+    """
+    requests = []
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if not isinstance(record, dict):
+            continue
+        event = record.get("event")
+        if event not in REPLAYABLE_EVENTS:
+            continue
+        if event == "search":
+            params = {"q": record["query"]} if record.get("query") else {}
+        else:
+            params = record.get("params", {})
+        requests.append(
+            LoggedRequest(
+                event=event,
+                path=record.get("url", "/search" if event == "search" else "/api/duckdb"),
+                params=params,
+                timestamp=record.get("timestamp"),
+                user_id=record.get("user_id"),
+            )
+        )
+    return requests
+
+
+def synthetic_mix(
+    requests: list[LoggedRequest], n: int, seed: int | None = None
+) -> list[LoggedRequest]:
+    """Draw n requests, with replacement, from a captured log."""
+    return random.Random(seed).choices(requests, k=n)
+
+
+def build_stub_datapackage(parquet_dir: Path) -> dict:
+    """Describe every Parquet file in a directory as a datapackage resource.
+
+    Only the bits the app actually reads are filled in: names, (empty)
+    descriptions and field names/types.
+    """
+    con = duckdb.connect(":memory:")
+    resources = []
+    for path in sorted(parquet_dir.glob("*.parquet")):
+        columns = con.execute(
+            "DESCRIBE SELECT * FROM read_parquet(?)", [str(path)]
+        ).fetchall()
+        resources.append(
+            {
+                "name": path.stem,
+                "path": path.name,
+                "description": "",
+                "schema": {
+                    "fields": [
+                        {
+                            "name": name,
+                            "type": DUCKDB_TO_FRICTIONLESS_TYPES.get(type_, "string"),
+                            "description": "",
+                        }
+                        for name, type_, *_ in columns
+                    ]
+                },
+            }
+        )
+    return {"name": "pudl_loadtest", "resources": resources}
+
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    """Nearest-rank percentile of an already-sorted list."""
+    if not sorted_values:
+        return 0.0
+    # round first so that e.g. 0.99 * 100 doesn't ceil up to 100.
+    rank = math.ceil(round(q * len(sorted_values), 9)) - 1
+    return sorted_values[max(0, rank)]
+
+
+def _peak_rss_mb() -> float:
+    """Peak resident set size of this process - ru_maxrss is in KB on Linux."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _current_rss_mb() -> float:
+    """Current resident set size of this process.
+
+    Only Linux exposes this cheaply, so fall back to the peak elsewhere.
+    """
+    try:
+        resident_pages = int(Path("/proc/self/statm").read_text().split()[1])
+    except (OSError, IndexError, ValueError):
+        return _peak_rss_mb()
+    return resident_pages * resource.getpagesize() / 1024 / 1024
+
+
+def summarize(
+    samples: list[Sample],
+    duration_s: float,
+    baseline_rss_mb: float,
+    startup_rss_mb: float,
+    peak_rss_mb: float,
+) -> Report:
+    """Roll individual samples up into per-endpoint percentiles."""
+    by_endpoint: dict[str, list[Sample]] = {}
+    for sample in samples:
+        by_endpoint.setdefault(sample.endpoint, []).append(sample)
+
+    endpoints = {}
+    for name, endpoint_samples in by_endpoint.items():
+        latencies = sorted(s.latency_s * 1000 for s in endpoint_samples)
+        endpoints[name] = EndpointStats(
+            count=len(endpoint_samples),
+            errors=sum(not s.ok for s in endpoint_samples),
+            p50_ms=_percentile(latencies, 0.50),
+            p95_ms=_percentile(latencies, 0.95),
+            p99_ms=_percentile(latencies, 0.99),
+        )
+
+    # local query executions are reported per-endpoint, but they aren't
+    # requests to the server so they don't count towards throughput.
+    server_samples = [s for s in samples if s.endpoint in REPLAYABLE_EVENTS]
+    num_requests = len(server_samples)
+    return Report(
+        requests=num_requests,
+        duration_s=duration_s,
+        throughput_rps=num_requests / duration_s if duration_s else 0.0,
+        error_rate=(
+            sum(not s.ok for s in server_samples) / num_requests
+            if num_requests
+            else 0.0
+        ),
+        baseline_rss_mb=baseline_rss_mb,
+        startup_rss_mb=startup_rss_mb,
+        peak_rss_mb=peak_rss_mb,
+        endpoints=endpoints,
+    )
+
+
+# each query-executing process keeps one connection, standing in for one
+# browser's duckdb-wasm.
+_client_con: duckdb.DuckDBPyConnection | None = None
+
+
+def _init_client(parquet_dir: str):
+    global _client_con
+    _client_con = duckdb.connect(":memory:")
+    escaped_dir = parquet_dir.replace("'", "''")
+    _client_con.execute(f"SET file_search_path = '{escaped_dir}'")
+
+
+def _execute_specs(specs: list[dict], count: bool) -> tuple[float, bool]:
+    """Run QuerySpecs the way the frontend does. Returns (seconds, ok)."""
+    start = time.perf_counter()
+    try:
+        for spec in specs:
+            page = _client_con.execute(spec["statement"], spec["values"]).fetchall()
+            # like the frontend, skip the count if we've been given one, or if
+            # it came back with the page.
+            if (
+                count
+                and spec.get("row_count") is None
+                and not (spec.get("combined") and page)
+            ):
+                _client_con.execute(spec["count_statement"], spec["values"]).fetchall()
+    except duckdb.Error:
+        return time.perf_counter() - start, False
+    return time.perf_counter() - start, True
+
+
+def run_load_test(
+    requests: list[LoggedRequest],
+    parquet_dir: Path,
+    concurrency: int = 4,
+    rate: float | None = None,
+    execute: bool = True,
+    anonymous_users: int = 1,
+    dictionaries_path: Path | None = None,
+    datapackage_path: Path | None = None,
+    seed: int | None = None,
+) -> Report:
+    """Replay requests against a fresh app and report how it held up.
+
+    If rate is set, requests arrive as a Poisson process at that many per
+    second, and latency is measured from each request's scheduled arrival so
+    that queueing behind busy workers shows up in the numbers. Otherwise
+    requests are sent back-to-back by ``concurrency`` workers.
+
+    If execute is set, each returned QuerySpec is also run (data and count
+    statements) against the local Parquet files and timed as
+    ``<event>:execute``. That happens in separate processes, so that the
+    simulated browsers' memory doesn't count towards the app's RSS.
+
+    Requests are attributed to the user_id they were logged with, so that
+    per-user admission control behaves as it did in production. Requests
+    without one are spread across anonymous_users pretend users.
+
+    Resident memory is measured just before and just after building the app,
+    so the difference is (roughly) what each worker spends on the catalog,
+    search index and caches. Pass datapackage_path to measure that with the
+    real datapackage rather than the stub.
+    """
+    parquet_dir = Path(parquet_dir).resolve()
+    with tempfile.TemporaryDirectory() as tmp:
+        if datapackage_path is None:
+            datapackage_path = Path(tmp) / "datapackage.json"
+            datapackage_path.write_text(
+                json.dumps(build_stub_datapackage(parquet_dir))
+            )
+        env = {
+            "PUDL_VIEWER_DATAPACKAGE_PATH": str(datapackage_path),
+            "PUDL_VIEWER_PARQUET_BASE": str(parquet_dir),
+            "PUDL_VIEWER_DICTIONARIES_PATH": (
+                str(dictionaries_path) if dictionaries_path else ""
+            ),
+            "PUDL_VIEWER_LOGIN_DISABLED": "true",
+            "PUDL_VIEWER_SECRET_KEY": "loadtest",
+            # the app never talks to the DB with login disabled, but the
+            # connection URI still has to parse.
+            "PUDL_VIEWER_DB_HOST": "localhost",
+            "PUDL_VIEWER_DB_PORT": "5432",
+            # don't let synthetic traffic into the real telemetry, and take
+            # the pretend users' addresses as they come.
+            "PUDL_VIEWER_TELEMETRY_PATH": "",
+            "PUDL_VIEWER_PROXY_HOPS": "0",
+        }
+        previous_env = {k: os.environ.get(k) for k in env}
+        os.environ.update(env)
+        gc.collect()
+        baseline_rss_mb = _current_rss_mb()
+        try:
+            app = create_app()
+        finally:
+            for k, v in previous_env.items():
+                if v is None:
+                    os.environ.pop(k, None)
+                else:
+                    os.environ[k] = v
+    # anything create_app() threw away shouldn't count.
+    gc.collect()
+    startup_rss_mb = _current_rss_mb()
+
+    local = threading.local()
+    # spawn rather than fork - we've got threads (and DuckDB) running.
+    clients = (
+        ProcessPoolExecutor(
+            max_workers=concurrency,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_client,
+            initargs=(str(parquet_dir),),
+        )
+        if execute
+        else None
+    )
+
+    def send(req: LoggedRequest, user: str, scheduled: float) -> list[Sample]:
+        if not hasattr(local, "client"):
+            local.client = app.test_client()
+        headers = {"HX-Request": "true"} if req.event == "search" else {}
+        try:
+            if req.event in POST_EVENTS:
+                resp = local.client.post(
+                    req.path, json=req.params, environ_base={"REMOTE_ADDR": user}
+                )
+            else:
+                resp = local.client.get(
+                    req.path,
+                    query_string=req.params,
+                    headers=headers,
+                    environ_base={"REMOTE_ADDR": user},
+                )
+            ok = resp.status_code < 400
+        except Exception:
+            resp, ok = None, False
+        samples = [Sample(req.event, time.perf_counter() - scheduled, ok)]
+
+        if execute and ok and req.event != "search":
+            body = resp.get_json()
+            specs = body["queries"] if req.event in POST_EVENTS else [body]
+            # batches are for exports, which never count.
+            elapsed, ok = clients.submit(
+                _execute_specs, specs, count=req.event not in POST_EVENTS
+            ).result()
+            samples.append(Sample(f"{req.event}:execute", elapsed, ok))
+        return samples
+
+    if clients:
+        # start the client processes up front, so that isn't timed.
+        for f in [clients.submit(_execute_specs, [], True) for _ in range(concurrency)]:
+            f.result()
+
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    futures = []
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            arrival = start
+            for i, req in enumerate(requests):
+                user = f"loadtest-{req.user_id or f'anonymous-{i % anonymous_users}'}"
+                if rate:
+                    arrival += rng.expovariate(rate)
+                    time.sleep(max(0.0, arrival - time.perf_counter()))
+                    futures.append(pool.submit(send, req, user, arrival))
+                else:
+                    futures.append(
+                        pool.submit(
+                            lambda r, u: send(r, u, time.perf_counter()), req, user
+                        )
+                    )
+            samples = [s for f in futures for s in f.result()]
+    finally:
+        if clients:
+            clients.shutdown()
+    duration_s = time.perf_counter() - start
+
+    return summarize(
+        samples, duration_s, baseline_rss_mb, startup_rss_mb, _peak_rss_mb()
+    )
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--log", type=Path, required=True, help="structlog JSON log to replay."
+    )
+    parser.add_argument(
+        "--parquet-dir",
+        type=Path,
+        required=True,
+        help="Directory of <table_name>.parquet files to serve and query.",
+    )
+    parser.add_argument(
+        "--synthetic",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Send N requests sampled from the log instead of replaying it verbatim.",
+    )
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=None,
+        help="Mean arrival rate in requests/second. Default: as fast as possible.",
+    )
+    parser.add_argument(
+        "--no-execute",
+        action="store_true",
+        help="Don't run the returned queries against the local Parquet files.",
+    )
+    parser.add_argument(
+        "--anonymous-users",
+        type=int,
+        default=1,
+        help="Spread requests logged without a user_id across this many users.",
+    )
+    parser.add_argument(
+        "--dictionaries",
+        type=Path,
+        default=None,
+        help="Value dictionaries to load, as built by parquet_fe_prototype.dictionaries.",
+    )
+    parser.add_argument(
+        "--datapackage",
+        type=Path,
+        default=None,
+        help="Serve this datapackage JSON instead of a stub built from --parquet-dir.",
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    args = parser.parse_args(argv)
+
+    with args.log.open() as f:
+        requests = read_event_log(f)
+    if args.synthetic is not None:
+        requests = synthetic_mix(requests, args.synthetic, seed=args.seed)
+
+    # keep logging on - it's part of the real per-request cost - but send it
+    # to stderr so it doesn't get mixed in with the report.
+    structlog.configure(logger_factory=structlog.PrintLoggerFactory(sys.stderr))
+
+    report = run_load_test(
+        requests,
+        parquet_dir=args.parquet_dir,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        execute=not args.no_execute,
+        anonymous_users=args.anonymous_users,
+        dictionaries_path=args.dictionaries,
+        datapackage_path=args.datapackage,
+        seed=args.seed,
+    )
+    print(json.dumps(asdict(report), indent=2) if args.json else report.to_text())
+
+
+if __name__ == "__main__":
+    main()
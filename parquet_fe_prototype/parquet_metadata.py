@@ -0,0 +1,267 @@
+"""Read Parquet footers so we can reason about queries before they run.
+
+The actual data never goes through the server - the browser queries the
+Parquet files directly - but the footer metadata is small and tells us how many
+rows and bytes a query will have to touch.
+"""
+
+import hashlib
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+import duckdb
+import structlog
+
+from parquet_fe_prototype.duckdb_query import Filter
+
+log = structlog.get_logger()
+
+NIGHTLY_PARQUET_BASE = "https://s3.us-west-2.amazonaws.com/pudl.catalyst.coop/nightly/"
+
+
+@dataclass(frozen=True)
+class ColumnChunkStats:
+    """Statistics for one column in one row group, as stringified by DuckDB."""
+
+    min: str | None
+    max: str | None
+    null_count: int | None
+
+
+@dataclass(frozen=True)
+class RowGroup:
+    num_rows: int
+    num_bytes: int
+    columns: dict[str, ColumnChunkStats]
+
+
+@dataclass(frozen=True)
+class TableMetadata:
+    """A Parquet file's footer.
+
+    fingerprint is a hash of the whole footer, so it changes whenever the
+    file's contents do - but not if the same file is just read from somewhere
+    else.
+    """
+
+    name: str
+    row_groups: tuple[RowGroup, ...]
+    fingerprint: str
+
+    @property
+    def num_rows(self) -> int:
+        return sum(rg.num_rows for rg in self.row_groups)
+
+    @property
+    def num_bytes(self) -> int:
+        return sum(rg.num_bytes for rg in self.row_groups)
+
+
+@dataclass(frozen=True)
+class ScanCost:
+    """Upper bound on how much of a table a query has to read."""
+
+    rows: int
+    bytes: int
+    row_groups: int
+
+
+class ParquetMetadataCache:
+    """Lazily fetch and remember the footer of each table's Parquet file.
+
+    base can be a local directory or a URL prefix - anything DuckDB can read
+    ``{base}{table_name}.parquet`` from. Only tables in known_tables are ever
+    looked up, since table names come straight from the client.
+
+    Footers are re-read after ttl_s, so that we notice when the nightly build
+    replaces a file. Failures are remembered for retry_after_s so that an
+    unreachable file doesn't make every request wait on a timeout.
+    """
+
+    def __init__(
+        self,
+        base: str,
+        known_tables: set[str],
+        ttl_s: float = 600,
+        retry_after_s: float = 300,
+    ):
+        self.base = base if base.endswith("/") else base + "/"
+        self.known_tables = known_tables
+        self.ttl_s = ttl_s
+        self.retry_after_s = retry_after_s
+        self._tables: dict[str, tuple[TableMetadata, float]] = {}
+        self._failures: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def get(self, table_name: str) -> TableMetadata | None:
+        """Return metadata for a table, or None if it's unknown/unavailable."""
+        table_name = table_name.removesuffix(".parquet")
+        if table_name not in self.known_tables:
+            return None
+        with self._lock:
+            cached = self._tables.get(table_name)
+            if cached is not None and time.monotonic() - cached[1] < self.ttl_s:
+                return cached[0]
+            failed_at = self._failures.get(table_name)
+            if failed_at is not None and time.monotonic() - failed_at < self.retry_after_s:
+                return None
+
+        try:
+            metadata = read_table_metadata(f"{self.base}{table_name}.parquet", table_name)
+        except duckdb.Error as e:
+            log.warning("parquet_metadata_unavailable", table=table_name, error=str(e))
+            with self._lock:
+                # don't keep serving a footer we can no longer check.
+                self._tables.pop(table_name, None)
+                self._failures[table_name] = time.monotonic()
+            return None
+
+        with self._lock:
+            self._tables[table_name] = (metadata, time.monotonic())
+            self._failures.pop(table_name, None)
+        return metadata
+
+    def warm(self, table_names: list[str]):
+        """Fetch metadata for these tables ahead of time."""
+        for table_name in table_names:
+            self.get(table_name)
+
+
+def read_table_metadata(path: str, table_name: str) -> TableMetadata:
+    """Read a Parquet footer from anywhere DuckDB can read it from."""
+    result = duckdb.connect(":memory:").execute(
+        """
+        SELECT * EXCLUDE (file_name) FROM parquet_metadata(?)
+        ORDER BY row_group_id, column_id
+        """,
+        [path],
+    )
+    columns = [col[0] for col in result.description]
+    rows = result.fetchall()
+
+    fingerprint = hashlib.sha256()
+    row_groups: dict[int, dict] = {}
+    for row in rows:
+        fingerprint.update(repr(row).encode())
+        r = dict(zip(columns, row))
+        rg = row_groups.setdefault(
+            r["row_group_id"],
+            {"num_rows": r["row_group_num_rows"], "num_bytes": 0, "columns": {}},
+        )
+        rg["num_bytes"] += r["total_compressed_size"]
+        rg["columns"][r["path_in_schema"]] = ColumnChunkStats(
+            min=r["stats_min_value"],
+            max=r["stats_max_value"],
+            null_count=r["stats_null_count"],
+        )
+    return TableMetadata(
+        name=table_name,
+        row_groups=tuple(RowGroup(**rg) for _, rg in sorted(row_groups.items())),
+        fingerprint=fingerprint.hexdigest()[:16],
+    )
+
+
+def _stat_value(stat: str | None, field_type: str):
+    """Coerce a stringified min/max statistic into something comparable with
+    the output of _filter_value. Returns None if we can't do that reliably.
+
+    Text is deliberately not comparable: the frontend uses a case-insensitive
+    collation, which doesn't respect the byte order of the min/max stats.
+    """
+    if stat is None:
+        return None
+    if field_type == "number":
+        try:
+            return float(stat)
+        except ValueError:
+            return None
+    if field_type in {"date", "datetime"}:
+        # DuckDB renders dates and timestamps as ISO strings, which sort
+        # correctly - a bare date sorts just before the same day's timestamps,
+        # just like midnight does.
+        return stat
+    return None
+
+
+def _filter_value(value, field_type: str):
+    """Coerce a filter value the same way the SQL placeholders cast it."""
+    if value is None:
+        return None
+    try:
+        if field_type == "number":
+            return float(value)
+        if field_type == "date":
+            return str(value)[:10]
+        if field_type == "datetime":
+            # datetime filter values are epoch milliseconds.
+            dt = datetime.fromtimestamp(int(value) / 1000, tz=timezone.utc)
+            return dt.strftime("%Y-%m-%d %H:%M:%S") + (
+                f".{dt.microsecond:06d}".rstrip("0") if dt.microsecond else ""
+            )
+    except (TypeError, ValueError, OverflowError):
+        return None
+    return None
+
+
+def _may_match(row_group: RowGroup, filter: Filter) -> bool:
+    """Could any row in this row group satisfy the filter?
+
+    Errs on the side of True whenever the statistics can't tell us.
+    """
+    stats = row_group.columns.get(filter.field_name)
+    if stats is None:
+        return True
+    op = filter.operation.lower()
+
+    if op == "blank":
+        return stats.null_count is None or stats.null_count > 0
+    if op == "notblank":
+        return stats.null_count is None or stats.null_count < row_group.num_rows
+
+    lo = _stat_value(stats.min, filter.field_type)
+    hi = _stat_value(stats.max, filter.field_type)
+    value = _filter_value(filter.value, filter.field_type)
+    if lo is None or hi is None or value is None:
+        return True
+
+    if op == "equals":
+        return lo <= value <= hi
+    if op == "greaterthan":
+        return hi > value
+    if op == "greaterthanorequal":
+        return hi >= value
+    if op == "lessthan":
+        return lo < value
+    if op == "lessthanorequal":
+        return lo <= value
+    if op == "inrange":
+        value_to = _filter_value(filter.value_to, filter.field_type)
+        return value_to is None or (hi >= value and lo <= value_to)
+    return True
+
+
+def estimate_scan_cost(
+    metadata: TableMetadata,
+    filters: list[Filter],
+    row_group_mask: int | None = None,
+) -> ScanCost:
+    """Estimate the rows/bytes a filtered scan reads, using row group pruning.
+
+    This mirrors the min/max pruning DuckDB does itself, so it's an upper bound
+    on what the query will actually fetch. If we know more than the min/max
+    stats do - i.e. from the value dictionaries - pass in a bitmap of the row
+    groups that can match.
+    """
+    matching = [
+        rg
+        for i, rg in enumerate(metadata.row_groups)
+        if (row_group_mask is None or row_group_mask >> i & 1)
+        and all(_may_match(rg, f) for f in filters)
+    ]
+    return ScanCost(
+        rows=sum(rg.num_rows for rg in matching),
+        bytes=sum(rg.num_bytes for rg in matching),
+        row_groups=len(matching),
+    )
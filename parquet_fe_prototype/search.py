@@ -1,8 +1,8 @@
 """Interact with the document search."""
 
 import re
+from collections import Counter
 
-from frictionless import Package, Resource
 import structlog
 
 # TODO 2025-01-15: think about switching this over to py-tantivy since that's better maintained
@@ -12,13 +12,16 @@ from whoosh.analysis import (
     LowercaseFilter,
     StopFilter,
     StemFilter,
+    STOP_WORDS,
 )
-from whoosh.fields import Schema, KEYWORD, TEXT, STORED
+from whoosh.fields import Schema, KEYWORD, TEXT
 from whoosh.filedb.filestore import RamStorage
 from whoosh.lang.porter import stem
 from whoosh.qparser import MultifieldParser
 from whoosh.query import AndMaybe, Or, Term
 
+from parquet_fe_prototype.catalog import Catalog, CatalogResource
+
 log = structlog.get_logger()
 
 
@@ -31,35 +34,158 @@ def custom_stemmer(word: str) -> str:
     return stem_map.get(word, stem(word))
 
 
-def initialize_index(datapackage: Package) -> index:
-    """Index the resources from a datapackage for later searching.
+def _damerau_levenshtein(a: str, b: str) -> int:
+    """Edit distance counting adjacent transpositions as one edit ("optimal
+    string alignment" distance)."""
+    prev_prev, prev = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev_prev[j - 2] + 1)
+        prev_prev, prev = prev, cur
+    return prev[-1]
+
+
+class SpellingCorrector:
+    """Typo correction using a precomputed symmetric-delete dictionary.
+
+    This is the SymSpell trick: for every word we know, store every string you
+    can get by deleting up to max_distance characters from it. Then a typo and
+    the word it was meant to be will share at least one of those deletions, so
+    looking up a query term's own deletions finds the candidates without
+    trying every possible edit.
 
-    Search index is stored in memory since it's such a small dataset.
+    Deletions are only taken from the first prefix_length characters of each
+    word, which keeps the dictionary small without losing many matches.
+
+    A query term counts as known if it stems (with custom_stemmer) to
+    something in the index, so we never "correct" e.g. generators -> generator.
+    """
+
+    def __init__(
+        self, word_counts: Counter, max_distance: int = 2, prefix_length: int = 7
+    ):
+        self.word_counts = word_counts
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.known_stems = {custom_stemmer(word) for word in word_counts}
+        self.deletes: dict[str, list[str]] = {}
+        for word in word_counts:
+            for deletion in self._deletions(word):
+                self.deletes.setdefault(deletion, []).append(word)
+
+    def _deletions(self, word: str) -> set[str]:
+        """The word's prefix, and everything up to max_distance deletions away."""
+        prefix = word[: self.prefix_length]
+        deletions = {prefix}
+        frontier = {prefix}
+        for _ in range(self.max_distance):
+            frontier = {
+                w[:i] + w[i + 1 :] for w in frontier for i in range(len(w)) if len(w) > 1
+            }
+            deletions |= frontier
+        return deletions
+
+    def _max_distance_for(self, word: str) -> int:
+        # two edits to a four-letter word can turn it into almost anything.
+        return 1 if len(word) <= 4 else self.max_distance
+
+    def is_known(self, word: str) -> bool:
+        return custom_stemmer(word.lower()) in self.known_stems
+
+    def suggest(self, word: str) -> str | None:
+        """Closest known word, breaking ties by how often it's used."""
+        word = word.lower()
+        max_distance = self._max_distance_for(word)
+        candidates = {
+            candidate
+            for deletion in self._deletions(word)
+            for candidate in self.deletes.get(deletion, [])
+            if abs(len(candidate) - len(word)) <= max_distance
+        }
+        scored = [
+            (distance, -self.word_counts[candidate], candidate)
+            for candidate in candidates
+            if (distance := _damerau_levenshtein(word, candidate)) <= max_distance
+        ]
+        return min(scored)[2] if scored else None
+
+    def correct(self, raw_query: str) -> str | None:
+        """Correct each unknown term in a query.
+
+        Leaves query syntax alone - operators, field names, wildcard and fuzzy
+        terms, quoted phrases, numbers, stop words - and returns None if
+        nothing needed correcting.
+        """
+        changed = False
+
+        def fix(match: re.Match) -> str:
+            nonlocal changed
+            word = match.group(0)
+            before = match.string[match.start() - 1 : match.start()]
+            after = match.string[match.end() : match.end() + 1]
+            is_operator = word in {"AND", "OR", "NOT", "ANDNOT", "ANDMAYBE"}
+            is_field_name = after == ":"
+            # e.g. generat* is meant to match more than one word.
+            is_pattern = before in {"*", "?"} or after in {"*", "?", "~"}
+            if (
+                is_operator
+                or is_field_name
+                or is_pattern
+                or len(word) < 3
+                or word.lower() in STOP_WORDS
+                or self.is_known(word)
+            ):
+                return word
+            suggestion = self.suggest(word)
+            if suggestion is None:
+                return word
+            changed = True
+            return suggestion
+
+        # don't touch anything in quotes - that's an exact phrase.
+        parts = re.split(r'("[^"]*")', raw_query)
+        corrected = "".join(
+            part if part.startswith('"') else re.sub(r"[A-Za-z]+", fix, part)
+            for part in parts
+        )
+        return corrected if changed else None
+
+
+def initialize_index(catalog: Catalog) -> tuple[index, SpellingCorrector]:
+    """Index the resources from the catalog for later searching.
+
+    Search index is stored in memory since it's such a small dataset. It only
+    stores resource names - hits are looked back up in the catalog.
+
+    Also builds a spelling corrector over every word we index, so that query
+    typos can be fixed before they hit the index.
     """
     storage = RamStorage()
 
-    analyzer = (
-        RegexTokenizer(r"[A-Za-z]+|[0-9]+")
-        | LowercaseFilter()
-        | StopFilter()
-        | StemFilter(custom_stemmer)
+    unstemmed_analyzer = (
+        RegexTokenizer(r"[A-Za-z]+|[0-9]+") | LowercaseFilter() | StopFilter()
     )
+    analyzer = unstemmed_analyzer | StemFilter(custom_stemmer)
+    word_counts = Counter()
     schema = Schema(
         name=TEXT(analyzer=analyzer, stored=True),
         description=TEXT(analyzer=analyzer),
         columns=TEXT(analyzer=analyzer),
         tags=KEYWORD(stored=True),
-        original_object=STORED,
     )
     ix = storage.create_index(schema)
     writer = ix.writer()
 
-    for resource in datapackage.resources:
+    for resource in catalog:
         description = re.sub("<[^<]+?>", "", resource.description)
         columns = "".join(
             (
                 " ".join([field.name, field.description])
-                for field in resource.schema.fields
+                for field in resource.fields
             )
         )
         tags = [resource.name.strip("_").split("_")[0]]
@@ -70,16 +196,21 @@ def initialize_index(datapackage: Package) -> index:
             name=resource.name,
             description=description,
             columns=columns,
-            original_object=resource.to_dict(),
             tags=" ".join(tags),
         )
+        for text in (resource.name, description, columns):
+            word_counts.update(
+                token.text
+                for token in unstemmed_analyzer(text)
+                if token.text.isalpha()
+            )
 
     writer.commit()
 
-    return ix
+    return ix, SpellingCorrector(word_counts)
 
 
-def run_search(ix: index, raw_query: str) -> list[Resource]:
+def run_search(ix: index, raw_query: str, catalog: Catalog) -> list[CatalogResource]:
     """Actually run a user query.
 
     This doctors the raw query with some field boosts + tag boosts.
@@ -101,4 +232,4 @@ def run_search(ix: index, raw_query: str) -> list[Resource]:
                 tags=hit["tags"],
                 score=hit.score,
             )
-        return [hit["original_object"] for hit in results]
+        return [catalog.get(hit["name"]) for hit in results]
@@ -0,0 +1,273 @@
+"""Record which tables and filters people actually query.
+
+Every QuerySpec we hand out is recorded in a local DuckDB file. Requests only
+drop a record on a queue; a background thread writes them out in batches, so
+the request never waits on disk.
+
+The same module has a small CLI for reading the data back:
+
+    $ python -m parquet_fe_prototype.telemetry --db telemetry.duckdb report
+    $ python -m parquet_fe_prototype.telemetry --db telemetry.duckdb hot-tables
+    $ python -m parquet_fe_prototype.telemetry --db telemetry.duckdb prefetch --mirror-dir ./nightly
+
+``prefetch`` is meant to run after each nightly refresh, to pull down the most
+used tables into a local mirror.
+"""
+
+import argparse
+import atexit
+import json
+import queue
+import threading
+import time
+from dataclasses import astuple, dataclass, fields
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import duckdb
+import requests
+import structlog
+
+from parquet_fe_prototype.duckdb_query import Filter
+from parquet_fe_prototype.parquet_metadata import NIGHTLY_PARQUET_BASE
+
+log = structlog.get_logger()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queries (
+    ts TIMESTAMP,
+    event VARCHAR,
+    table_name VARCHAR,
+    filter_shape VARCHAR,
+    num_filters INTEGER,
+    page INTEGER,
+    per_page INTEGER,
+    user_id VARCHAR,
+    decision VARCHAR,
+    server_ms DOUBLE
+)
+"""
+
+
+@dataclass(frozen=True)
+class QueryRecord:
+    """One compiled query. Field order matches the queries table."""
+
+    ts: datetime
+    event: str
+    table_name: str
+    filter_shape: str
+    num_filters: int
+    page: int
+    per_page: int
+    user_id: str | None
+    decision: str
+    server_ms: float
+
+
+def filter_shape(filters: list[Filter]) -> str:
+    """Which columns are filtered, and how - but not the values."""
+    return json.dumps(sorted([f.field_name, f.operation.lower()] for f in filters))
+
+
+class TelemetryWriter:
+    """Batch QueryRecords into a DuckDB file from a background thread.
+
+    We only hold the DuckDB file open while writing a batch, so that the
+    reporting CLI (or another worker process) can get at it in between. If
+    the file is locked we keep the batch and try again next time - that goes
+    for creating the table, too, so a locked file never stops the app from
+    starting.
+
+    If we fall too far behind, new records are dropped rather than letting the
+    queue grow without bound.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        batch_size: int = 200,
+        flush_interval_s: float = 5.0,
+        max_queue: int = 10_000,
+    ):
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self.max_queue = max_queue
+        self.dropped = 0
+        self._queue: queue.Queue[QueryRecord | None] = queue.Queue(maxsize=max_queue)
+        self._pending: list[QueryRecord] = []
+
+        self._thread = threading.Thread(
+            target=self._run, name="telemetry-writer", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, record: QueryRecord):
+        """Queue a record for writing. Never blocks."""
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        """Write out everything that's been recorded so far and stop."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _run(self):
+        deadline = time.monotonic() + self.flush_interval_s
+        while True:
+            try:
+                record = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                pass
+            else:
+                if record is None:
+                    self._flush()
+                    return
+                self._pending.append(record)
+            if len(self._pending) >= self.batch_size or time.monotonic() >= deadline:
+                self._flush()
+                deadline = time.monotonic() + self.flush_interval_s
+
+    def _flush(self):
+        if not self._pending:
+            return
+        # if the file's locked, let the backlog build up to max_queue at most.
+        self._pending = self._pending[-self.max_queue :]
+        try:
+            with duckdb.connect(str(self.path)) as con:
+                con.execute(SCHEMA)
+                con.executemany(
+                    f"INSERT INTO queries VALUES ({', '.join('?' for _ in fields(QueryRecord))})",
+                    [astuple(r) for r in self._pending],
+                )
+        except duckdb.Error as e:
+            log.warning("telemetry_flush_failed", error=str(e), pending=len(self._pending))
+            return
+        self._pending = []
+
+
+def _since(days: float) -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=days)
+
+
+def hot_tables(path: Path, limit: int = 20, days: float = 7) -> list[str]:
+    """Most queried tables over the last few days, most popular first."""
+    with duckdb.connect(str(path), read_only=True) as con:
+        rows = con.execute(
+            """
+            SELECT table_name FROM queries
+            WHERE ts >= ?
+            GROUP BY table_name
+            ORDER BY COUNT(*) DESC, table_name
+            LIMIT ?
+            """,
+            [_since(days), limit],
+        ).fetchall()
+    return [table_name for (table_name,) in rows]
+
+
+def report(path: Path, limit: int = 20, days: float = 7) -> dict[str, tuple]:
+    """Hottest tables, hottest filter shapes, and slowest queries.
+
+    Returns {section title: (headers, rows)}.
+    """
+    since = _since(days)
+    queries = {
+        "Hottest tables": """
+            SELECT table_name, COUNT(*) AS queries,
+                COUNT(DISTINCT user_id) AS users,
+                COUNT(*) FILTER (WHERE event = 'duckdb_csv') AS csv_pages,
+                ROUND(quantile_cont(server_ms, 0.5), 2) AS p50_ms,
+                ROUND(quantile_cont(server_ms, 0.95), 2) AS p95_ms
+            FROM queries WHERE ts >= ?
+            GROUP BY table_name
+            ORDER BY queries DESC
+            LIMIT ?
+        """,
+        "Hottest filters": """
+            SELECT table_name, filter_shape, COUNT(*) AS queries,
+                COUNT(DISTINCT user_id) AS users
+            FROM queries WHERE ts >= ? AND num_filters > 0
+            GROUP BY table_name, filter_shape
+            ORDER BY queries DESC
+            LIMIT ?
+        """,
+        "Slowest queries": """
+            SELECT ts, event, table_name, filter_shape, page, per_page,
+                decision, ROUND(server_ms, 2) AS server_ms
+            FROM queries WHERE ts >= ?
+            ORDER BY server_ms DESC
+            LIMIT ?
+        """,
+    }
+    sections = {}
+    with duckdb.connect(str(path), read_only=True) as con:
+        for title, sql in queries.items():
+            result = con.execute(sql, [since, limit])
+            headers = [col[0] for col in result.description]
+            sections[title] = (headers, result.fetchall())
+    return sections
+
+
+def prefetch(
+    table_names: list[str], mirror_dir: Path, base: str = NIGHTLY_PARQUET_BASE
+):
+    """Download tables' Parquet files into a local mirror directory.
+
+    Files are written to a temporary name first and renamed into place, so
+    nothing reading the mirror ever sees half a file.
+    """
+    mirror_dir.mkdir(parents=True, exist_ok=True)
+    base = base if base.endswith("/") else base + "/"
+    for table_name in table_names:
+        url = f"{base}{table_name}.parquet"
+        destination = mirror_dir / f"{table_name}.parquet"
+        partial = destination.with_suffix(".parquet.partial")
+        log.info("prefetch", url=url, destination=str(destination))
+        with requests.get(url, stream=True, timeout=60) as resp:
+            resp.raise_for_status()
+            with partial.open("wb") as f:
+                for chunk in resp.iter_content(chunk_size=1 << 20):
+                    f.write(chunk)
+        partial.replace(destination)
+
+
+def _format_table(headers: list[str], rows: list[tuple]) -> str:
+    cells = [headers] + [["" if v is None else str(v) for v in row] for row in rows]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(headers))]
+    lines = ["  ".join(v.ljust(w) for v, w in zip(row, widths)) for row in cells]
+    lines.insert(1, "  ".join("-" * w for w in widths))
+    return "\n".join(line.rstrip() for line in lines)
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--db", type=Path, required=True, help="Telemetry DuckDB file.")
+    parser.add_argument("--days", type=float, default=7, help="Look back this many days.")
+    parser.add_argument("--limit", type=int, default=20)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("report", help="Print hottest tables/filters and slowest queries.")
+    subparsers.add_parser("hot-tables", help="Print the hottest table names, one per line.")
+    prefetch_parser = subparsers.add_parser(
+        "prefetch", help="Download the hottest tables into a local mirror."
+    )
+    prefetch_parser.add_argument("--mirror-dir", type=Path, required=True)
+    prefetch_parser.add_argument("--base", default=NIGHTLY_PARQUET_BASE)
+    args = parser.parse_args(argv)
+
+    if args.command == "report":
+        for title, (headers, rows) in report(args.db, args.limit, args.days).items():
+            print(f"{title}\n{_format_table(headers, rows)}\n")
+    elif args.command == "hot-tables":
+        print("\n".join(hot_tables(args.db, args.limit, args.days)))
+    elif args.command == "prefetch":
+        prefetch(hot_tables(args.db, args.limit, args.days), args.mirror_dir, args.base)
+
+
+if __name__ == "__main__":
+    main()
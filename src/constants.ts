@@ -24,3 +24,11 @@ export const DATE_TYPE_IDS = new Set(
 );
 
 export const DATE_TS_TYPE_IDS = new Set([...TIMESTAMP_TYPE_IDS, ...DATE_TYPE_IDS]);
+
+// in combined queries, the total row count comes back in this column. Mirrors
+// TOTAL_ROWS_COLUMN in the Python code.
+export const TOTAL_ROWS_COLUMN = "__total_rows";
+
+// the most pages /api/duckdb/batch will hand out at once. Mirrors
+// MAX_BATCH_PAGES in the Python code.
+export const MAX_BATCH_PAGES = 100;
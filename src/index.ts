@@ -1,7 +1,7 @@
 import * as duckdb from '@duckdb/duckdb-wasm';
 import * as arrow from 'apache-arrow';
 
-import { DATE_TS_TYPE_IDS, DATE_TYPE_IDS, TIMESTAMP_TYPE_IDS } from './constants';
+import { DATE_TS_TYPE_IDS, DATE_TYPE_IDS, MAX_BATCH_PAGES, TIMESTAMP_TYPE_IDS, TOTAL_ROWS_COLUMN } from './constants';
 import { createGrid, themeQuartz, colorSchemeDark, ModuleRegistry, AllCommunityModule, GridApi, GridOptions } from 'ag-grid-community';
 import Alpine, { AlpineComponent } from 'alpinejs';
 
@@ -22,6 +22,14 @@ interface Filter {
   valueTo: any;
 }
 
+interface Sort {
+  /**
+   * One column in the sort order. Mirrors Sort in the Python code.
+   */
+  colId: string;
+  sort: "asc" | "desc";
+}
+
 interface QuerySpec {
   /**
    * What we need to send a query to duckdb.
@@ -29,6 +37,9 @@ interface QuerySpec {
   statement: string;
   count_statement: string;
   values: Array<any>;
+  row_count: number | null;
+  combined: boolean;
+  approximate: boolean;
 }
 
 interface QueryEndpointPayload {
@@ -40,6 +51,7 @@ interface QueryEndpointPayload {
   conn: duckdb.AsyncDuckDBConnection;
   tableName: string;
   filters: Array<Filter>;
+  sort: Array<Sort>;
   page: number;
   perPage: number
 }
@@ -51,10 +63,12 @@ interface UnitializedTableState extends AlpineComponent<{}> {
   tableName: string | null;
   numRowsMatched: number | null;
   numRowsDisplayed: number;
+  approximate: boolean;
   addedTables: Set<string>;
   showPreview: boolean;
   csvExportPageSize: number;
   exporting: boolean;
+  exportError: string | null;
   loading: boolean;
   darkMode: boolean;
   gridApi: GridApi | null;
@@ -72,10 +86,12 @@ interface TableState extends AlpineComponent<{}> {
   tableName: string;
   numRowsMatched: number;
   numRowsDisplayed: number;
+  approximate: boolean;
   addedTables: Set<string>;
   showPreview: boolean;
   csvExportPageSize: number;
   exporting: boolean;
+  exportError: string | null;
   loading: boolean;
   darkMode: boolean;
   gridApi: GridApi;
@@ -90,10 +106,12 @@ const data: UnitializedTableState = {
   tableName: null,
   numRowsMatched: null,
   numRowsDisplayed: 0,
+  approximate: false,
   addedTables: new Set(),
   showPreview: false,
   csvExportPageSize: 1_000_000,
   exporting: false,
+  exportError: null,
   loading: false,
   darkMode: window.matchMedia('(prefers-color-scheme: dark)').matches,
   gridApi: null,
@@ -117,6 +135,7 @@ const data: UnitializedTableState = {
 
     const gridOptions: GridOptions = {
       onFilterChanged: async () => refreshTable(this as TableState),
+      onSortChanged: async () => refreshTable(this as TableState),
       tooltipShowDelay: 500,
       tooltipHideDelay: 15000,
     }
@@ -125,6 +144,7 @@ const data: UnitializedTableState = {
     this.$watch("tableName", async () => {
       this.loading = true;
       this.gridApi?.setFilterModel({});
+      this.gridApi?.applyColumnState({ defaultState: { sort: null } });
       await refreshTable(this as TableState);
       this.loading = false;
     });
@@ -145,14 +165,39 @@ const data: UnitializedTableState = {
      */
     const state = this as TableState;
     const { conn, tableName, gridApi, csvExportPageSize } = state;
+    if (state.numRowsMatched === 0) {
+      return;
+    }
     state.exporting = true;
-    const numPages = Math.ceil(state.numRowsMatched / state.csvExportPageSize);
-
-    for (let i = 1; i <= numPages; i++) {
-      const filename = numPages === 1 ? tableName : `${tableName}_part${i}`;
-      await exportPage(gridApi, filename, { conn, tableName, page: i, perPage: csvExportPageSize, filters: getFilters(gridApi) })
+    state.exportError = null;
+    const filters = getFilters(gridApi);
+    const sort = getSort(gridApi);
+    // if the count's only an estimate, it's an upper bound - so we might run
+    // out of rows before we run out of pages.
+    const numPages = Math.ceil(state.numRowsMatched / csvExportPageSize);
+    try {
+      windows: for (let firstPage = 1; firstPage <= numPages; firstPage += MAX_BATCH_PAGES) {
+        const { queries, pages } = await _getDuckDBQueries({
+          tableName,
+          filters,
+          sort,
+          perPage: csvExportPageSize,
+          firstPage,
+          lastPage: Math.min(numPages, firstPage + MAX_BATCH_PAGES - 1),
+        });
+        for (const [i, query] of queries.entries()) {
+          const filename = numPages === 1 ? tableName : `${tableName}_part${pages[i]}`;
+          const numRows = await exportPage(gridApi, filename, conn, query);
+          if (numRows === 0) {
+            break windows;
+          }
+        }
+      }
+    } catch (e) {
+      state.exportError = `Export failed: ${e instanceof Error ? e.message : e}`;
+    } finally {
+      state.exporting = false;
     }
-    state.exporting = false;
   },
 
   csvAllowed() {
@@ -182,7 +227,7 @@ async function refreshTable(state: TableState) {
    * the table state object too?
    *
    * - check if the table has been registered - if not, register it.
-   * - grab filters, table name, and get arrowData + a count back.
+   * - grab filters, sort, table name, and get arrowData + a count back.
    * - turn arrowData into gridOptions.
    * - update the counters.
    * - throw the gridOptions at the gridApi.
@@ -196,11 +241,13 @@ async function refreshTable(state: TableState) {
     addedTables.add(tableName);
   }
   const filters = getFilters(gridApi);
-  const { arrowData, numRowsMatched } = await getAndCountData({ conn, tableName, filters, page: 1, perPage: 10_000 });
+  const sort = getSort(gridApi);
+  const { arrowData, numRowsMatched, approximate } = await getAndCountData({ conn, tableName, filters, sort, page: 1, perPage: 10_000 });
   const gridOptions = arrowTableToAgGridOptions(arrowData);
   gridApi.updateGridOptions(gridOptions);
 
   state.numRowsMatched = numRowsMatched;
+  state.approximate = approximate;
   state.numRowsDisplayed = arrowData.numRows;
   gridApi.setGridOption('loading', false);
 }
@@ -222,47 +269,85 @@ function getFilters(gridApi: GridApi): Array<Filter> {
     );
 }
 
+function getSort(gridApi: GridApi): Array<Sort> {
+  /**
+   * Get the sorted columns, in order of precedence, so the server can sort
+   * the whole result set instead of AG Grid sorting just the rows we fetched.
+   */
+  return gridApi.getColumnState()
+    .filter(col => col.sort)
+    .sort((a, b) => (a.sortIndex ?? 0) - (b.sortIndex ?? 0))
+    .map(col => ({ colId: col.colId, sort: col.sort! }));
+}
+
 async function getAndCountData(params: QueryEndpointPayload) {
   /**
    * Get the data, and also count how many the full result would be.
    *
    * - get the DuckDB query
-   * - run the main query and the count query on DuckDB
+   * - run the main query and get the count, either:
+   *   - from the server, if it already knows;
+   *   - from the main query, if the server combined the two;
+   *   - or by running the count query alongside the main one
+   * - if we had to count, tell the server, so it can remember
    * - return both
    */
-  const { conn, tableName, filters, page, perPage } = params;
-  const { statement, count_statement: countStatement, values: filterVals } = await _getDuckDBQuery(
-    { tableName, filters: filters, page, perPage }
+  const { conn, tableName, filters, sort, page, perPage } = params;
+  const {
+    statement, count_statement: countStatement, values: filterVals, row_count: rowCount, combined, approximate
+  } = await _getDuckDBQuery(
+    { tableName, filters: filters, sort, page, perPage }
   );
   const stmt = await conn.prepare(statement);
+  if (rowCount !== null && rowCount !== undefined) {
+    const arrowData = dropTotalRows(await stmt.query(...filterVals));
+    return { arrowData, numRowsMatched: rowCount, approximate }
+  }
+  if (combined) {
+    const result = await stmt.query(...filterVals);
+    // if the page is empty there's no total to read - but then, if this was
+    // the first page, there's nothing to count either.
+    const total = result.getChild(TOTAL_ROWS_COLUMN)?.get(0);
+    const numRowsMatched = (total !== null && total !== undefined) ? Number(total) : (page === 1 ? 0 : null);
+    if (numRowsMatched !== null) {
+      if (!approximate) {
+        _reportCount({ tableName, filters, count: numRowsMatched });
+      }
+      return { arrowData: dropTotalRows(result), numRowsMatched, approximate }
+    }
+  }
   const counter = await conn.prepare(countStatement);
   const [countResult, arrowData] = await Promise.all(
     [counter.query(...filterVals), stmt.query(...filterVals)]
   );
   const numRowsMatched = parseInt(countResult?.getChild("count_star()")?.get(0));
+  if (!approximate) {
+    _reportCount({ tableName, filters, count: numRowsMatched });
+  }
 
-  return { arrowData, numRowsMatched }
+  return { arrowData: dropTotalRows(arrowData), numRowsMatched, approximate }
 
 }
 
-async function getData(params: QueryEndpointPayload) {
+function dropTotalRows(table: arrow.Table): arrow.Table {
   /**
-   * Get the data, and also count how many the full result would be.
-   *
-   * - get the DuckDB query
-   * - run the main query on DuckDB
+   * Get rid of the total row count column that combined queries tack on.
    */
-  const { conn, tableName, filters, page, perPage } = params;
-  const { statement, values: filterVals } = await _getDuckDBQuery(
-    { tableName, filters: filters, page, perPage }
-  );
-  const stmt = await conn.prepare(statement);
-  const arrowData = await stmt.query(...filterVals);
-  return arrowData;
+  const names = table.schema.fields.map(f => f.name).filter(name => name !== TOTAL_ROWS_COLUMN);
+  return names.length === table.numCols ? table : table.select(names);
+}
+
+async function getData(conn: duckdb.AsyncDuckDBConnection, query: QuerySpec) {
+  /**
+   * Run an already-compiled query on DuckDB - no counting.
+   */
+  const stmt = await conn.prepare(query.statement);
+  const arrowData = await stmt.query(...query.values);
+  return dropTotalRows(arrowData);
 }
 
 
-async function exportPage(gridApi: GridApi, filename: string, params: QueryEndpointPayload) {
+async function exportPage(gridApi: GridApi, filename: string, conn: duckdb.AsyncDuckDBConnection, query: QuerySpec) {
   /**
    * Actually do the downloading/CSV export for a single page.
    *
@@ -270,8 +355,14 @@ async function exportPage(gridApi: GridApi, filename: string, params: QueryEndpo
    * - reshape it into CSV
    * - make a blob
    * - download it
+   *
+   * Returns the number of rows exported - if there are none, there's no
+   * download.
    */
-  const arrowTable = await getData(params);
+  const arrowTable = await getData(conn, query);
+  if (arrowTable.numRows === 0) {
+    return 0;
+  }
   const { rowData } = arrowTableToAgGridOptions(arrowTable);
 
   const columns = gridApi.getColumns()?.map(col => col.colId) ?? [];
@@ -290,6 +381,7 @@ async function exportPage(gridApi: GridApi, filename: string, params: QueryEndpo
   link.download = `${filename}.csv`;
   link.click();
   URL.revokeObjectURL(url);
+  return arrowTable.numRows;
 };
 
 function arrowTableToAgGridOptions(table: arrow.Table): GridOptions {
@@ -331,8 +423,10 @@ function arrowTableToAgGridOptions(table: arrow.Table): GridOptions {
   const typeOpts = new Map([...timestampOpts, ...dateOpts])
 
   // TODO 2025-02-19: it would be nice to add the column descriptions into the header tooltip. might want to grab the datapackage.json for that.
+  // the server does the sorting - AG Grid should leave the row order alone.
   const defaultOpts = {
     filter: true,
+    comparator: () => 0,
     filterParams: { maxNumConditions: 1, buttons: ["apply", "clear", "reset"] },
     tooltipValueGetter: ({ value }) => {
       const isLongString = typeof value === "string" && value.length > 20;
@@ -399,22 +493,78 @@ async function _addTableToDuckDB(db: duckdb.AsyncDuckDB, tableName: string) {
 
 
 async function _getDuckDBQuery(
-  { tableName, filters, page = 1, perPage = 10000 }
-    : { tableName: string, filters: Array<Filter>, page?: number, perPage?: number }
+  { tableName, filters, sort = [], page = 1, perPage = 10000 }
+    : { tableName: string, filters: Array<Filter>, sort?: Array<Sort>, page?: number, perPage?: number }
 ): Promise<QuerySpec> {
   /**
    * Get DuckDB query from the backend, based on the filter rules & what table we're looking at.
+   *
+   * If we're over our query budget the server says so with a 429 - wait as
+   * long as it asks, then try again.
    */
   const params = new URLSearchParams(
     {
       name: `${tableName}.parquet`,
       filters: JSON.stringify(filters),
+      sort: JSON.stringify(sort),
       page: page.toString(),
       perPage: perPage.toString()
     }
   );
-  const resp = await fetch("/api/duckdb?" + params);
+  let resp = await fetch("/api/duckdb?" + params);
+  while (resp.status === 429) {
+    const retryAfter = parseInt(resp.headers.get("Retry-After") ?? "1");
+    console.log(`Over query budget, retrying in ${retryAfter}s`);
+    await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
+    resp = await fetch("/api/duckdb?" + params);
+  }
   const query = await resp.json();
   console.log("QuerySpec:", query);
   return query
 }
+
+
+async function _getDuckDBQueries(
+  { tableName, filters, sort = [], perPage, firstPage, lastPage }
+    : { tableName: string, filters: Array<Filter>, sort?: Array<Sort>, perPage: number, firstPage: number, lastPage: number }
+): Promise<{ queries: Array<QuerySpec>, pages: Array<number> }> {
+  /**
+   * Get the DuckDB queries for pages firstPage to lastPage in one request -
+   * at most MAX_BATCH_PAGES of them.
+   *
+   * Like _getDuckDBQuery, waits out any 429s. Throws on any other error.
+   */
+  const request = () => fetch("/api/duckdb/batch", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ name: `${tableName}.parquet`, filters, sort, perPage, firstPage, lastPage }),
+  });
+  let resp = await request();
+  while (resp.status === 429) {
+    const retryAfter = parseInt(resp.headers.get("Retry-After") ?? "1");
+    console.log(`Over query budget, retrying in ${retryAfter}s`);
+    await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
+    resp = await request();
+  }
+  if (!resp.ok) {
+    const { error } = await resp.json().catch(() => ({ error: resp.statusText }));
+    throw new Error(error ?? resp.statusText);
+  }
+  const batch = await resp.json();
+  console.log("QuerySpecs:", batch);
+  return batch
+}
+
+
+async function _reportCount(
+  { tableName, filters, count }: { tableName: string, filters: Array<Filter>, count: number }
+) {
+  /**
+   * Tell the backend how many rows matched, so nobody has to count them again.
+   */
+  await fetch("/api/duckdb/count", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ name: `${tableName}.parquet`, filters, count }),
+  });
+}
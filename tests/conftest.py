@@ -0,0 +1,22 @@
+from pathlib import Path
+
+import duckdb
+import pytest
+
+
+@pytest.fixture(scope="session")
+def write_parquet(tmp_path_factory):
+    """Write the result of a query to <name>.parquet in a fresh directory.
+
+    Returns that directory, which is what the app and the caches want.
+    """
+
+    def write(name: str, query: str, row_group_size: int | None = None) -> Path:
+        parquet_dir = tmp_path_factory.mktemp("parquet")
+        options = f" (ROW_GROUP_SIZE {row_group_size})" if row_group_size else ""
+        duckdb.execute(
+            f"COPY ({query}) TO '{parquet_dir / f'{name}.parquet'}'{options}"
+        )
+        return parquet_dir
+
+    return write
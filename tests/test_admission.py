@@ -0,0 +1,68 @@
+from parquet_fe_prototype.admission import (
+    ALLOW,
+    DOWNGRADE,
+    REJECT,
+    AdmissionController,
+    TokenBucket,
+)
+from parquet_fe_prototype.parquet_metadata import ScanCost
+
+
+def test_token_bucket():
+    bucket = TokenBucket(capacity=10, refill_per_s=1)
+    assert bucket.wait_time(10, now=0) == 0
+    bucket.take(10, now=0)
+    assert bucket.wait_time(4, now=1) == 3
+    # can't ask for more than a full bucket's worth of waiting.
+    assert bucket.wait_time(100, now=1) == 9
+
+
+def test_admission_token_budget():
+    admission = AdmissionController(
+        capacity=10, refill_per_s=1, max_concurrent=100, bytes_per_token=1_000
+    )
+    expensive = ScanCost(rows=1_000, bytes=4_000, row_groups=1)
+
+    assert admission.admit("alice", expensive, can_downgrade=False, now=0).action == ALLOW
+    assert admission.admit("alice", expensive, can_downgrade=False, now=0).action == ALLOW
+    rejected = admission.admit("alice", expensive, can_downgrade=False, now=0)
+    assert rejected.action == REJECT
+    assert rejected.reason == "rate_limited"
+    assert rejected.retry_after_s == 5
+    assert admission.admit("alice", expensive, can_downgrade=True, now=0).action == DOWNGRADE
+    # other users have their own budget
+    assert admission.admit("bob", expensive, can_downgrade=False, now=0).action == ALLOW
+    assert admission.admit("alice", expensive, can_downgrade=False, now=5).action == ALLOW
+
+
+def test_admission_concurrency():
+    admission = AdmissionController(
+        max_concurrent=1, scan_bytes_per_s=1_000, min_lease_s=1
+    )
+    cost = ScanCost(rows=1_000, bytes=10_000, row_groups=1)
+
+    assert admission.admit("alice", cost, can_downgrade=False, now=0).action == ALLOW
+    busy = admission.admit("alice", cost, can_downgrade=False, now=2)
+    assert busy.action == REJECT
+    assert busy.reason == "too_many_concurrent"
+    assert busy.retry_after_s == 8
+    assert admission.admit("alice", cost, can_downgrade=False, now=10).action == ALLOW
+
+
+def test_admission_replaces_lease():
+    admission = AdmissionController(
+        max_concurrent=2, scan_bytes_per_s=1_000, min_lease_s=1
+    )
+    cost = ScanCost(rows=1_000, bytes=10_000, row_groups=1)
+
+    # changing the filters on a preview frees up the old preview's slot...
+    for now in range(5):
+        decision = admission.admit(
+            "alice", cost, can_downgrade=True, now=now, replaces="preview:plants"
+        )
+        assert decision.action == ALLOW
+    # ...but it's still holding one, as are other tables' previews.
+    assert admission.admit(
+        "alice", cost, can_downgrade=True, now=5, replaces="preview:generators"
+    ).action == ALLOW
+    assert admission.admit("alice", cost, can_downgrade=False, now=5).action == REJECT
@@ -0,0 +1,210 @@
+import json
+
+import pytest
+
+import parquet_fe_prototype
+from parquet_fe_prototype import create_app
+from parquet_fe_prototype.loadtest import build_stub_datapackage
+from parquet_fe_prototype.telemetry import TelemetryWriter, report
+
+
+@pytest.fixture(scope="module")
+def parquet_dir(write_parquet):
+    return write_parquet(
+        "numbers",
+        "SELECT range AS integer_col, CAST(range AS VARCHAR) AS string_col FROM range(100)",
+    )
+
+
+@pytest.fixture(scope="module")
+def app_env(parquet_dir, tmp_path_factory):
+    datapackage_path = tmp_path_factory.mktemp("datapackage") / "datapackage.json"
+    datapackage_path.write_text(json.dumps(build_stub_datapackage(parquet_dir)))
+    return {
+        "PUDL_VIEWER_DATAPACKAGE_PATH": str(datapackage_path),
+        "PUDL_VIEWER_PARQUET_BASE": str(parquet_dir),
+        "PUDL_VIEWER_LOGIN_DISABLED": "true",
+        "PUDL_VIEWER_SECRET_KEY": "test",
+        "PUDL_VIEWER_DB_HOST": "localhost",
+        "PUDL_VIEWER_DB_PORT": "5432",
+        "PUDL_VIEWER_PROXY_HOPS": "1",
+    }
+
+
+@pytest.fixture(scope="module")
+def app(app_env):
+    with pytest.MonkeyPatch.context() as mp:
+        for k, v in app_env.items():
+            mp.setenv(k, v)
+        return create_app()
+
+
+@pytest.fixture
+def client(app, request):
+    # every test gets its own address, so admission budgets don't leak.
+    client = app.test_client()
+    client.environ_base["REMOTE_ADDR"] = request.node.name
+    return client
+
+
+@pytest.mark.parametrize(
+    "query_string",
+    [{}, {"name": "nonexistent.parquet"}, {"name": "../../etc/passwd"}],
+)
+def test_duckdb_unknown_table(client, query_string):
+    assert client.get("/api/duckdb", query_string=query_string).status_code == 400
+
+
+def test_admission_by_forwarded_address(client):
+    csv_export = {"name": "numbers.parquet", "perPage": 1_000_000}
+
+    def export(address):
+        return client.get(
+            "/api/duckdb",
+            query_string=csv_export,
+            headers={"X-Forwarded-For": address},
+        )
+
+    # two concurrent scans per user, and then you have to wait...
+    assert export("192.0.2.1").status_code == 200
+    assert export("192.0.2.1").status_code == 200
+    assert export("192.0.2.1").status_code == 429
+    # ...but that's per user, not per proxy.
+    assert export("192.0.2.2").status_code == 200
+
+
+@pytest.mark.parametrize(
+    "query_string",
+    [
+        {"filters": "[{"},
+        {"filters": '[{"bad": 1}]'},
+        {"sort": "[{"},
+        {"sort": '[{"colId": "integer_col", "sort": "sideways"}]'},
+        {"sort": '[{"colId": "nonexistent", "sort": "asc"}]'},
+    ],
+)
+def test_bad_previews_are_free(client, query_string):
+    for _ in range(3):
+        response = client.get(
+            "/api/duckdb", query_string={"name": "numbers.parquet", **query_string}
+        )
+        assert response.status_code == 400
+    response = client.get("/api/duckdb", query_string={"name": "numbers.parquet"})
+    assert not response.get_json()["approximate"]
+
+
+def test_refiltering_previews(client):
+    # each new preview replaces the last one, so doesn't need another slot.
+    for limit in range(10, 15):
+        filters = [dict(FILTERS[0], value=limit)]
+        response = client.get(
+            "/api/duckdb",
+            query_string={"name": "numbers.parquet", "filters": json.dumps(filters)},
+        )
+        assert not response.get_json()["approximate"]
+
+
+def test_search_correction(client):
+    html = client.get("/search", query_string={"q": "numbrs"}).get_data(as_text=True)
+    assert "Showing results for <strong>numbers</strong>" in html
+    assert "/search?q=numbrs&amp;exact=1" in html
+
+    html = client.get("/search", query_string={"q": "numbrs", "exact": 1}).get_data(
+        as_text=True
+    )
+    assert "Showing results for" not in html
+
+
+FILTERS = [
+    {"fieldName": "integer_col", "fieldType": "number", "operation": "lessThan", "value": 10}
+]
+
+
+def preview(client, address, filters=FILTERS):
+    return client.get(
+        "/api/duckdb",
+        query_string={"name": "numbers.parquet", "filters": json.dumps(filters)},
+        headers={"X-Forwarded-For": address},
+    ).get_json()
+
+
+def report_count(client, address, body):
+    return client.post(
+        "/api/duckdb/count", json=body, headers={"X-Forwarded-For": address}
+    ).status_code
+
+
+def test_counts_are_per_user(client):
+    body = {"name": "numbers.parquet", "filters": FILTERS, "count": 10}
+    assert report_count(client, "192.0.2.1", body) == 204
+    assert preview(client, "192.0.2.1")["row_count"] == 10
+    assert preview(client, "192.0.2.2")["row_count"] is None
+
+    # unfiltered counts always come from the footer.
+    body = {"name": "numbers.parquet", "filters": [], "count": 0}
+    assert report_count(client, "192.0.2.1", body) == 204
+    assert preview(client, "192.0.2.1", filters=[])["row_count"] == 100
+
+
+def test_combined_previews(client):
+    def combined(**query_string):
+        return client.get(
+            "/api/duckdb",
+            query_string={"name": "numbers.parquet", "filters": json.dumps(FILTERS)}
+            | query_string,
+        ).get_json()["combined"]
+
+    # a sort would stop the top-N optimisation...
+    assert not combined(sort='[{"colId": "integer_col", "sort": "desc"}]')
+    assert combined()
+    # ...and once we know the count there's no need.
+    body = {"name": "numbers.parquet", "filters": FILTERS, "count": 10}
+    assert client.post("/api/duckdb/count", json=body).status_code == 204
+    assert not combined()
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        None,
+        [],
+        {"filters": [], "count": 1},
+        {"name": "nonexistent.parquet", "filters": [], "count": 1},
+        {"name": "numbers.parquet", "filters": [{"bad": 1}], "count": 1},
+        {"name": "numbers.parquet", "filters": [], "count": -1},
+        {"name": "numbers.parquet", "filters": [], "count": True},
+        {"name": "numbers.parquet", "filters": [], "count": 101},
+    ],
+)
+def test_bad_counts(client, body):
+    assert report_count(client, "192.0.2.1", body) == 400
+
+
+def test_batch_pages_without_row_count(client):
+    body = {"name": "numbers.parquet", "filters": FILTERS, "perPage": 30}
+    # nobody's counted these rows, so we page through all 100 that might match.
+    assert client.post("/api/duckdb/batch", json=body).get_json()["pages"] == [1, 2, 3, 4]
+    body["rowCount"] = 10
+    assert client.post("/api/duckdb/batch", json=body).get_json()["pages"] == [1]
+
+
+def test_batch_telemetry(app_env, monkeypatch, tmp_path):
+    path = tmp_path / "telemetry.duckdb"
+    writers = []
+
+    def telemetry_writer(path):
+        writers.append(TelemetryWriter(path))
+        return writers[-1]
+
+    monkeypatch.setattr(parquet_fe_prototype, "TelemetryWriter", telemetry_writer)
+    for k, v in {**app_env, "PUDL_VIEWER_TELEMETRY_PATH": str(path)}.items():
+        monkeypatch.setenv(k, v)
+    client = create_app().test_client()
+    body = {"name": "numbers.parquet", "perPage": 1_000_000, "pages": [1, 2, 3]}
+    assert client.post("/api/duckdb/batch", json=body).status_code == 200
+    writers[0].close()
+
+    headers, rows = report(path)["Hottest tables"]
+    # exports are counted per page, however they were asked for.
+    assert rows[0][headers.index("queries")] == 3
+    assert rows[0][headers.index("csv_pages")] == 3
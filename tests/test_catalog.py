@@ -0,0 +1,47 @@
+from frictionless import Package
+
+from parquet_fe_prototype.catalog import build_catalog
+
+
+def _field(name, description):
+    return {"name": name, "type": "integer", "description": description}
+
+
+def test_build_catalog():
+    datapackage = Package.from_descriptor(
+        {
+            "name": "pudl",
+            "resources": [
+                {
+                    "name": name,
+                    "path": f"{name}.parquet",
+                    "description": f"The {name} table.",
+                    "schema": {
+                        "fields": [
+                            _field("plant_id_eia", "EIA plant ID."),
+                            _field(f"{name}_value", "A value."),
+                        ],
+                        "primaryKey": ["plant_id_eia"],
+                    },
+                }
+                for name in ["core_b", "out_a", "other"]
+            ],
+        }
+    )
+    catalog = build_catalog(datapackage, sort_key=lambda r: r.name)
+
+    assert [r.name for r in catalog] == ["core_b", "other", "out_a"]
+    out_a = catalog.get("out_a")
+    assert out_a.field_names == ["plant_id_eia", "out_a_value"]
+    assert out_a.primary_key == ("plant_id_eia",)
+    assert catalog.get("missing") is None
+
+    # shared columns' descriptions are stored once.
+    core_b = catalog.get("core_b")
+    assert core_b.fields[0].description is out_a.fields[0].description
+    assert core_b.fields[1].description is out_a.fields[1].description
+
+    # the version only changes when the datapackage does.
+    assert build_catalog(datapackage).version == catalog.version
+    datapackage.resources[0].description = "Something else."
+    assert build_catalog(datapackage).version != catalog.version
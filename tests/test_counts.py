@@ -0,0 +1,22 @@
+from parquet_fe_prototype.counts import CountCache, normalize_filters
+from parquet_fe_prototype.duckdb_query import Filter
+
+
+def test_normalize_filters_ignores_order_and_case():
+    a = Filter(field_name="state", field_type="text", operation="equals", value="CO")
+    b = Filter(field_name="report_year", field_type="number", operation="greaterThan", value=2020)
+    shouty = Filter(field_name="state", field_type="text", operation="EQUALS", value="CO")
+    assert normalize_filters([a, b]) == normalize_filters([b, shouty])
+    assert normalize_filters([a]) != normalize_filters([b])
+    assert normalize_filters([]) == "[]"
+
+
+def test_count_cache_evicts_least_recently_used():
+    cache = CountCache(max_entries=2)
+    cache.put(("user", "v1", "a", "[]"), 1)
+    cache.put(("user", "v1", "b", "[]"), 2)
+    assert cache.get(("user", "v1", "a", "[]")) == 1
+    cache.put(("user", "v1", "c", "[]"), 3)
+    assert cache.get(("user", "v1", "b", "[]")) is None
+    assert cache.get(("user", "v1", "a", "[]")) == 1
+    assert cache.get(("user", "v1", "c", "[]")) == 3
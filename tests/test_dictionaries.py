@@ -0,0 +1,118 @@
+import json
+
+import duckdb
+import pytest
+
+from parquet_fe_prototype.dictionaries import (
+    build_table_dictionary,
+    dump_dictionaries,
+    load_dictionaries,
+)
+from parquet_fe_prototype.duckdb_query import Filter, ag_grid_to_duckdb
+from parquet_fe_prototype.parquet_metadata import ParquetMetadataCache
+
+
+@pytest.fixture(scope="module")
+def parquet_dir(write_parquet):
+    # states are sorted, so each one only shows up in some row groups.
+    return write_parquet(
+        "plants",
+        """
+        SELECT
+            range AS id,
+            ['CA', 'CO', 'NY', 'TX'][range // 75000 + 1] AS state,
+            2020 + range % 3 AS report_year,
+            CAST(range AS VARCHAR) AS high_cardinality
+        FROM range(300000)
+        """,
+        row_group_size=100000,
+    )
+
+
+@pytest.fixture(scope="module")
+def dictionary(parquet_dir):
+    return build_table_dictionary(parquet_dir / "plants.parquet", max_cardinality=10)
+
+
+def test_build_dictionary(parquet_dir, dictionary):
+    assert set(dictionary.columns) == {"state", "report_year"}
+    assert dictionary.columns["report_year"].kind == "number"
+    assert set(dictionary.columns["state"].values) == {"CA", "CO", "NY", "TX"}
+    assert dictionary.columns["state"].values["CA"] == 0b1
+
+    metadata = ParquetMetadataCache(str(parquet_dir), {"plants"}).get("plants")
+    assert dictionary.is_current(metadata)
+
+    roundtripped = load_dictionaries(
+        json.loads(json.dumps(dump_dictionaries({"plants": dictionary})))
+    )
+    assert roundtripped == {"plants": dictionary}
+
+
+def test_small_table_dictionary(write_parquet):
+    # small enough that file_row_number would pass for low-cardinality.
+    parquet_dir = write_parquet(
+        "small", "SELECT range AS id, 'CO' AS state FROM range(50)"
+    )
+    dictionary = build_table_dictionary(parquet_dir / "small.parquet")
+    assert set(dictionary.columns) == {"id", "state"}
+
+
+def test_stale_dictionary(write_parquet, dictionary):
+    # same shape as plants.parquet, different values.
+    parquet_dir = write_parquet(
+        "plants",
+        """
+        SELECT
+            range AS id,
+            ['CA', 'CO', 'NY', 'WY'][range // 75000 + 1] AS state,
+            2020 + range % 3 AS report_year,
+            CAST(range AS VARCHAR) AS high_cardinality
+        FROM range(300000)
+        """,
+        row_group_size=100000,
+    )
+    metadata = ParquetMetadataCache(str(parquet_dir), {"plants"}).get("plants")
+    assert not dictionary.is_current(metadata)
+
+    unfingerprinted = load_dictionaries(
+        {"plants": {"num_rows": 300000, "num_row_groups": 3, "columns": {}}}
+    )
+    assert not unfingerprinted["plants"].is_current(metadata)
+
+
+@pytest.mark.parametrize(
+    "filter,expected_values",
+    [
+        (Filter(field_name="state", field_type="text", operation="equals", value="ny"), ["NY"]),
+        (Filter(field_name="state", field_type="text", operation="contains", value="c"), ["CA", "CO"]),
+        (Filter(field_name="state", field_type="text", operation="equals", value="ZZ"), []),
+        (Filter(field_name="state", field_type="text", operation="startsWith", value="C"), None),
+        (Filter(field_name="report_year", field_type="number", operation="equals", value=2021), [2021]),
+    ],
+)
+def test_lookup(dictionary, filter, expected_values):
+    column = dictionary.columns[filter.field_name]
+    assert column.lookup(filter) == expected_values
+
+
+def test_row_group_mask(dictionary):
+    state_filter = Filter(field_name="state", field_type="text", operation="equals", value="CA")
+    year_filter = Filter(field_name="report_year", field_type="number", operation="equals", value=2020)
+    assert dictionary.row_group_mask([year_filter]) == 0b111
+    assert dictionary.row_group_mask([state_filter, year_filter]) == 0b1
+    assert dictionary.row_group_mask([]) is None
+
+
+def test_query_with_dictionary(parquet_dir, dictionary):
+    con = duckdb.connect(":memory:")
+    con.execute(f"SET file_search_path = '{parquet_dir}'")
+    contains = Filter(field_name="state", field_type="text", operation="contains", value="c")
+    query = ag_grid_to_duckdb("plants.parquet", [contains], dictionary=dictionary)
+    assert "IN (?, ?)" in query.statement
+    assert con.execute(query.count_statement, query.values).fetchone()[0] == 150000
+
+    missing = Filter(field_name="state", field_type="text", operation="equals", value="ZZ")
+    query = ag_grid_to_duckdb("plants.parquet", [contains, missing], dictionary=dictionary)
+    assert query.row_count == 0
+    assert con.execute(query.statement, query.values).fetchall() == []
@@ -4,7 +4,12 @@ from collections import namedtuple
 import duckdb
 import pytest
 
-from parquet_fe_prototype.duckdb_query import Filter, ag_grid_to_duckdb
+from parquet_fe_prototype.duckdb_query import (
+    Filter,
+    Sort,
+    ag_grid_to_duckdb,
+    page_range,
+)
 
 
 @pytest.fixture(scope="session")
@@ -114,3 +119,101 @@ def test_spot_check_filters(con: duckdb.DuckDBPyConnection, filters, rows, row_n
     results = con.execute(query.statement, query.values).fetchall()
     assert len(results) == len(row_nums)
     assert results == [rows[i] for i in row_nums]
+
+
+COLUMNS = [
+    "integer_col",
+    "float_col",
+    "date_col",
+    "datetime_col",
+    "string_col",
+    "boolean_col",
+]
+
+
+@pytest.mark.parametrize(
+    "sorts,row_nums",
+    [
+        ([Sort(col_id="integer_col", sort="desc")], [4, 3, 2, 1, 0]),
+        # ties on boolean_col are broken by the integer_col tiebreaker.
+        ([Sort(col_id="boolean_col", sort="asc")], [1, 3, 0, 2, 4]),
+        (
+            [Sort(col_id="boolean_col", sort="desc"), Sort(col_id="date_col", sort="desc")],
+            [4, 2, 0, 3, 1],
+        ),
+    ],
+)
+def test_sort(con: duckdb.DuckDBPyConnection, sorts, rows, row_nums):
+    query = ag_grid_to_duckdb(
+        "numbers", [], sorts=sorts, columns=COLUMNS, tiebreakers=["integer_col"]
+    )
+    results = con.execute(query.statement, query.values).fetchall()
+    assert results == [rows[i] for i in row_nums]
+
+
+def test_sorted_page(con: duckdb.DuckDBPyConnection, rows):
+    filters = [
+        Filter(field_name="integer_col", field_type="number", operation="lessThan", value=4)
+    ]
+    query = ag_grid_to_duckdb(
+        "numbers",
+        filters,
+        sorts=[Sort(col_id="float_col", sort="desc")],
+        columns=COLUMNS,
+    )
+    results = con.execute(query.statement + " LIMIT 2 OFFSET 1", query.values).fetchall()
+    assert results == [rows[2], rows[1]]
+
+
+def test_sort_unknown_column():
+    with pytest.raises(ValueError):
+        ag_grid_to_duckdb(
+            "numbers",
+            [],
+            sorts=[Sort.model_validate({"colId": "1; DROP TABLE numbers", "sort": "asc"})],
+            columns=COLUMNS,
+        )
+
+
+def test_combined(con: duckdb.DuckDBPyConnection, rows):
+    filters = [
+        Filter(field_name="integer_col", field_type="number", operation="lessThan", value=4)
+    ]
+    query = ag_grid_to_duckdb("numbers", filters, combined=True)
+    results = con.execute(query.statement + " LIMIT 2", query.values).fetchall()
+    assert query.combined
+    assert [r[:-1] for r in results] == [tuple(r) for r in rows[:2]]
+    assert {r[-1] for r in results} == {4}
+    (count,) = con.execute(query.count_statement, query.values).fetchone()
+    assert count == 4
+
+
+@pytest.mark.parametrize(
+    "kwargs,pages",
+    [
+        ({"pages": [3, 1]}, [3, 1]),
+        ({"first_page": 2, "last_page": 4}, [2, 3, 4]),
+        ({"last_page": 2, "prefetch": 2}, [1, 2, 3, 4]),
+        ({"row_count": 25}, [1, 2, 3]),
+        ({"row_count": 30}, [1, 2, 3]),
+        # always at least one page, even if it's empty.
+        ({"row_count": 0}, [1]),
+        ({"pages": []}, []),
+    ],
+)
+def test_page_range(kwargs, pages):
+    assert page_range(10, **kwargs) == pages
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {},
+        {"pages": [0, 1]},
+        {"first_page": 1, "last_page": 10**12, "max_pages": 100},
+        {"last_page": 99, "prefetch": 2, "max_pages": 100},
+    ],
+)
+def test_page_range_invalid(kwargs):
+    with pytest.raises(ValueError):
+        page_range(10, **kwargs)
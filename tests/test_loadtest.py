@@ -0,0 +1,106 @@
+import json
+
+import pytest
+import structlog
+
+import parquet_fe_prototype
+from parquet_fe_prototype.loadtest import (
+    LoggedRequest,
+    Sample,
+    read_event_log,
+    run_load_test,
+    summarize,
+)
+
+
+@pytest.fixture
+def parquet_dir(write_parquet):
+    return write_parquet(
+        "numbers",
+        "SELECT range AS integer_col, CAST(range AS VARCHAR) AS string_col FROM range(100)",
+    )
+
+
+def test_read_event_log():
+    lines = [
+        "not json at all",
+        json.dumps({"event": "loading datapackage"}),
+        json.dumps({"event": "search", "url": "/search", "query": "generators"}),
+        json.dumps(
+            {
+                "event": "duckdb_csv",
+                "url": "/api/duckdb",
+                "params": {"name": "numbers.parquet", "perPage": "1000000"},
+                "timestamp": "2025-02-13T00:00:00Z",
+            }
+        ),
+    ]
+    assert read_event_log(lines) == [
+        LoggedRequest(event="search", path="/search", params={"q": "generators"}),
+        LoggedRequest(
+            event="duckdb_csv",
+            path="/api/duckdb",
+            params={"name": "numbers.parquet", "perPage": "1000000"},
+            timestamp="2025-02-13T00:00:00Z",
+        ),
+    ]
+
+
+def test_summarize():
+    samples = [Sample("search", i / 1000, ok=i != 100) for i in range(1, 101)]
+    samples.append(Sample("search:execute", 1.0, ok=False))
+    report = summarize(
+        samples, duration_s=2.0, baseline_rss_mb=5, startup_rss_mb=10, peak_rss_mb=20
+    )
+    assert report.requests == 100
+    assert report.throughput_rps == 50
+    assert report.error_rate == 0.01
+    assert report.endpoints["search"].p50_ms == 50
+    assert report.endpoints["search"].p99_ms == 99
+    assert report.endpoints["search:execute"].errors == 1
+
+
+def test_run_load_test(parquet_dir, monkeypatch, tmp_path):
+    # configured for the real app, which the load test should leave alone.
+    monkeypatch.setenv("PUDL_VIEWER_TELEMETRY_PATH", str(tmp_path / "telemetry.duckdb"))
+    monkeypatch.setenv("PUDL_VIEWER_PROXY_HOPS", "1")
+
+    def telemetry_writer(path):
+        raise AssertionError(f"load test traffic recorded in {path}")
+
+    monkeypatch.setattr(parquet_fe_prototype, "TelemetryWriter", telemetry_writer)
+    filters = [
+        {"fieldName": "integer_col", "fieldType": "number", "operation": "lessThan", "value": 10}
+    ]
+    requests = [
+        LoggedRequest(event="search", path="/search", params={"q": "numbers"}),
+        LoggedRequest(
+            event="duckdb_preview",
+            path="/api/duckdb",
+            params={"name": "numbers.parquet", "filters": json.dumps(filters)},
+        ),
+        LoggedRequest(
+            event="duckdb_batch",
+            path="/api/duckdb/batch",
+            params={
+                "name": "numbers.parquet",
+                "filters": filters,
+                "perPage": 3,
+                "rowCount": 10,
+                "prefetch": 1,
+            },
+        ),
+    ] * 5
+    logging_config = structlog.get_config()
+    report = run_load_test(
+        requests, parquet_dir=parquet_dir, concurrency=2, anonymous_users=5
+    )
+    assert structlog.get_config() == logging_config
+    assert report.requests == 15
+    assert report.error_rate == 0
+    assert report.endpoints["duckdb_preview:execute"].count == 5
+    assert report.endpoints["duckdb_preview:execute"].errors == 0
+    assert report.endpoints["duckdb_batch:execute"].count == 5
+    assert report.endpoints["duckdb_batch:execute"].errors == 0
+    assert 0 < report.baseline_rss_mb <= report.peak_rss_mb
+    assert 0 < report.startup_rss_mb <= report.peak_rss_mb
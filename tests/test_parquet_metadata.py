@@ -0,0 +1,92 @@
+import pytest
+
+from parquet_fe_prototype.duckdb_query import Filter
+from parquet_fe_prototype.parquet_metadata import (
+    ParquetMetadataCache,
+    estimate_scan_cost,
+)
+
+
+@pytest.fixture(scope="module")
+def parquet_dir(write_parquet):
+    # three row groups, each with a disjoint range of ints/dates.
+    return write_parquet(
+        "numbers",
+        """
+        SELECT
+            range AS integer_col,
+            DATE '2024-01-01' + CAST(range // 1000 AS INTEGER) AS date_col,
+            CAST(range AS VARCHAR) AS string_col
+        FROM range(300000)
+        """,
+        row_group_size=100000,
+    )
+
+
+@pytest.fixture(scope="module")
+def metadata_cache(parquet_dir):
+    return ParquetMetadataCache(str(parquet_dir), known_tables={"numbers"})
+
+
+def test_metadata(metadata_cache):
+    metadata = metadata_cache.get("numbers.parquet")
+    assert metadata.num_rows == 300000
+    assert len(metadata.row_groups) > 1
+    assert metadata_cache.get("../../etc/passwd") is None
+
+
+def test_metadata_expires(parquet_dir):
+    metadata_cache = ParquetMetadataCache(str(parquet_dir), {"numbers"}, ttl_s=0)
+    first = metadata_cache.get("numbers")
+    second = metadata_cache.get("numbers")
+    assert first is not second
+    assert first.fingerprint == second.fingerprint
+
+
+@pytest.mark.parametrize(
+    "filters,expected_row_groups",
+    [
+        ([], "all"),
+        (
+            [Filter(field_name="integer_col", field_type="number", operation="equals", value=5)],
+            1,
+        ),
+        (
+            [
+                Filter(
+                    field_name="integer_col",
+                    field_type="number",
+                    operation="greaterThan",
+                    value=1_000_000,
+                )
+            ],
+            0,
+        ),
+        (
+            [
+                Filter(
+                    field_name="date_col",
+                    field_type="date",
+                    operation="lessThan",
+                    value="2024-01-02 00:00:00",
+                )
+            ],
+            1,
+        ),
+        # text isn't pruned, because of the case-insensitive collation.
+        (
+            [Filter(field_name="string_col", field_type="text", operation="equals", value="zzz")],
+            "all",
+        ),
+    ],
+)
+def test_estimate_scan_cost(metadata_cache, filters, expected_row_groups):
+    metadata = metadata_cache.get("numbers")
+    if expected_row_groups == "all":
+        expected_row_groups = len(metadata.row_groups)
+    cost = estimate_scan_cost(metadata, filters)
+    assert cost.row_groups == expected_row_groups
+    assert cost.rows == sum(
+        rg.num_rows for rg in metadata.row_groups[:expected_row_groups]
+    )
+    assert cost.bytes <= metadata.num_bytes
@@ -0,0 +1,77 @@
+import pytest
+from frictionless import Package
+
+from parquet_fe_prototype.catalog import build_catalog
+from parquet_fe_prototype.search import initialize_index, run_search
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    datapackage = Package.from_descriptor(
+        {
+            "name": "pudl",
+            "resources": [
+                {
+                    "name": "out_eia__monthly_generators",
+                    "path": "out_eia__monthly_generators.parquet",
+                    "description": "Monthly generator capacity and operating status.",
+                    "schema": {
+                        "fields": [
+                            {"name": "plant_id_eia", "type": "integer", "description": "Plant ID."},
+                            {"name": "prime_mover_code", "type": "string", "description": "Prime mover."},
+                        ]
+                    },
+                },
+                {
+                    "name": "out_eia923__fuel_receipts_costs",
+                    "path": "out_eia923__fuel_receipts_costs.parquet",
+                    "description": "Fuel receipts and costs for coal, oil and gas.",
+                    "schema": {
+                        "fields": [
+                            {"name": "fuel_cost_per_mmbtu", "type": "number", "description": "Fuel cost."},
+                        ]
+                    },
+                },
+            ],
+        }
+    )
+    return build_catalog(datapackage)
+
+
+@pytest.fixture(scope="module")
+def search_index(catalog):
+    return initialize_index(catalog)
+
+
+@pytest.mark.parametrize(
+    "raw_query,expected",
+    [
+        ("genrators", "generators"),
+        ("feul receipts", "fuel receipts"),
+        ("fuel recipts", "fuel receipts"),
+        # known words, including other forms of known stems, are left alone.
+        ("generator", None),
+        ("fuel receipt", None),
+        # as is query syntax.
+        ('"feul receipts" OR costs', None),
+        ("name:genrators", "name:generators"),
+        ('"fuel" name:genrators', '"fuel" name:generators'),
+        ("fue*", None),
+        ("*cots", None),
+        ("cots?", None),
+        ("genrators~", None),
+        ("genrators~2 feul", "genrators~2 fuel"),
+        # nothing close enough
+        ("xylophone", None),
+    ],
+)
+def test_spelling_correction(search_index, raw_query, expected):
+    _, spelling = search_index
+    assert spelling.correct(raw_query) == expected
+
+
+def test_corrected_search(search_index, catalog):
+    ix, spelling = search_index
+    assert run_search(ix, "feul receipts", catalog) == []
+    results = run_search(ix, spelling.correct("feul receipts"), catalog)
+    assert results == [catalog.get("out_eia923__fuel_receipts_costs")]
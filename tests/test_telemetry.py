@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta, timezone
+
+from parquet_fe_prototype.duckdb_query import Filter
+from parquet_fe_prototype.telemetry import (
+    QueryRecord,
+    TelemetryWriter,
+    filter_shape,
+    hot_tables,
+    report,
+)
+
+
+def make_record(table_name, server_ms=1.0, filters=(), days_ago=0):
+    return QueryRecord(
+        ts=datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=days_ago),
+        event="duckdb_preview",
+        table_name=table_name,
+        filter_shape=filter_shape(list(filters)),
+        num_filters=len(filters),
+        page=1,
+        per_page=10_000,
+        user_id="1",
+        decision="allow",
+        server_ms=server_ms,
+    )
+
+
+def test_filter_shape():
+    filters = [
+        Filter(field_name="state", field_type="text", operation="equals", value="CA"),
+        Filter(field_name="report_year", field_type="number", operation="greaterThan", value=2020),
+    ]
+    assert filter_shape(filters) == '[["report_year", "greaterthan"], ["state", "equals"]]'
+
+
+def test_telemetry_roundtrip(tmp_path):
+    path = tmp_path / "telemetry.duckdb"
+    writer = TelemetryWriter(path, batch_size=2, flush_interval_s=60)
+    state_filter = Filter(field_name="state", field_type="text", operation="equals", value="CA")
+    for record in [
+        make_record("plants", filters=[state_filter]),
+        make_record("plants", server_ms=50.0),
+        make_record("generators"),
+        make_record("ancient_history", days_ago=30),
+    ]:
+        writer.record(record)
+    writer.close()
+
+    assert hot_tables(path, days=7) == ["plants", "generators"]
+    sections = report(path, days=7)
+    assert [row[0] for row in sections["Hottest tables"][1]] == ["plants", "generators"]
+    assert sections["Hottest filters"][1] == [("plants", '[["state", "equals"]]', 1, 1)]
+    slowest = sections["Slowest queries"]
+    assert slowest[1][0][slowest[0].index("server_ms")] == 50.0
+
+
+def test_telemetry_unwritable(tmp_path):
+    # stands in for a file another process has locked: we can't open it.
+    path = tmp_path / "telemetry.duckdb"
+    path.mkdir()
+    writer = TelemetryWriter(path, batch_size=1, flush_interval_s=60)
+    writer.record(make_record("plants"))
+    writer.close()
+    assert len(writer._pending) == 1